@@ -0,0 +1,7 @@
+# общий код — пакет facecluster в корне репозитория; core/ оставлен, чтобы приложение запускалось из своей папки
+import sys
+from pathlib import Path
+
+_ROOT = str(Path(__file__).resolve().parents[2])
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
@@ -1,10 +1,10 @@
 import streamlit as st
-import json
-import shutil
+import time
 from pathlib import Path
 from PIL import Image
 import psutil
-from core.cluster import build_plan, IMG_EXTS
+from core.cluster import CLUSTER_METHODS, IMG_EXTS
+from core.jobs import JobManager, QUEUED, RUNNING, DONE, FAILED, CANCELLED, FINISHED, UNDO
 
 st.set_page_config("Кластеризация лиц", layout="wide")
 st.title("📸 Кластеризация лиц и распределение по папкам")
@@ -113,103 +113,96 @@ if st.session_state["queue"]:
     if st.button("🧹 Очистить очередь"):
         st.session_state["queue"] = []
 
-# --- Распределение по кластерам ---
-def distribute_to_folders(plan, base_dir: Path):
-    moved, copied = 0, 0
-    cluster_dirs = set()
-    moved_paths = set()
-
-    for item in plan.get("plan", []):
-        src = Path(item["path"])
-        clusters = item["cluster"]
-        if not src.exists():
-            continue
-
-        if len(clusters) == 1:
-            cluster_id = clusters[0]
-            dst = base_dir / f"cluster_{cluster_id}" / src.name
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            try:
-                shutil.move(str(src), str(dst))
-                moved += 1
-                cluster_dirs.add(cluster_id)
-                moved_paths.add(src.parent)
-            except Exception as e:
-                st.error(f"❌ Ошибка перемещения {src} → {dst}: {e}")
-        else:
-            success_count = 0
-            total_targets = 0
-            for cluster_id in clusters:
-                dst = base_dir / f"cluster_{cluster_id}" / src.name
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                total_targets += 1
-                try:
-                    shutil.copy2(str(src), str(dst))
-                    copied += 1
-                    success_count += 1
-                except Exception as e:
-                    st.error(f"❌ Ошибка копирования {src} → {dst}: {e}")
-            if success_count == total_targets:
-                try:
-                    src.unlink()
-                    moved_paths.add(src.parent)
-                except Exception as e:
-                    st.warning(f"⚠️ Не удалось удалить оригинал {src}: {e}")
-
-    for p in sorted(moved_paths, key=lambda x: len(str(x)), reverse=True):
-        try:
-            if p.exists() and not any(p.iterdir()):
-                p.rmdir()
-        except Exception:
-            pass
-
-    return moved, copied
-
 # --- Обработка очереди ---
-if st.session_state["queue"] and st.button("🚀 Обработать всю очередь"):
-    cluster_offset = 1  # глобальный счётчик кластеров
-
-    for folder in st.session_state["queue"]:
-        path = Path(folder)
-        st.markdown(f"### 📂 Обработка: `{path}`")
-        if not path.exists():
-            st.error("❌ Путь не существует.")
-            continue
-
-        with st.spinner("🧠 Кластеризация..."):
-            plan = build_plan(path)
-
-        # --- Перенумерация кластеров ---
-        old_to_new = {}
-        for i, cid in enumerate(sorted(plan.get("clusters", {}).keys()), start=cluster_offset):
-            old_to_new[int(cid)] = i
-
-        plan["clusters"] = {
-            old_to_new[int(k)]: v for k, v in plan.get("clusters", {}).items() if int(k) in old_to_new
-        }
-
-        for entry in plan.get("plan", []):
-            entry["cluster"] = [old_to_new[cid] for cid in entry.get("cluster", []) if cid in old_to_new]
-
-        cluster_count = len(old_to_new)
-        cluster_offset += cluster_count
-
-        with open(f"plan_{path.name}.json", "w", encoding="utf-8") as f:
-            json.dump(plan, f, ensure_ascii=False, indent=2)
-
-        moved, copied = distribute_to_folders(plan, path)
-
-        st.success(f"✅ Готово. Перемещено: {moved}, Скопировано и удалено оригиналов: {copied}")
-
-        if plan.get("unreadable"):
-            st.warning(f"📛 Нечитаемых файлов: {len(plan['unreadable'])}")
-            st.code("\n".join(plan["unreadable"][:30]))
-
-        if plan.get("no_faces"):
-            st.warning(f"🙈 Без лиц: {len(plan['no_faces'])}")
-            st.code("\n".join(plan["no_faces"][:30]))
-
-        if plan.get("tqdm_log"):
-            st.code(plan["tqdm_log"], language="bash")
+@st.cache_resource
+def get_job_manager():
+    # общий для всех сессий: задачи продолжаются при перезапуске скрипта и закрытии вкладки
+    return JobManager()
+
+jobs = get_job_manager()
+
+with st.sidebar:
+    st.subheader("⚙️ Параметры обработки")
+    memory_budget_mb = st.number_input("💾 Бюджет памяти, МБ (0 — без ограничения)", min_value=0, value=0, step=1024)
+    min_side = st.number_input("🔍 Пропускать изображения меньше, пикс. (0 — не пропускать)", min_value=0, value=0, step=32)
+    method = st.selectbox("🧮 Кластеризация", CLUSTER_METHODS, help="two-stage — для библиотек в сотни тысяч лиц: микрокластеры, затем HDBSCAN по их центрам")
+    gallery = st.text_input("👤 Галерея известных людей (.npz, необязательно)", help="создаётся командой cli.py gallery add; их фото попадут в папки с именами").strip()
+    keep_faces = st.checkbox("🧑 Сохранять в плане таблицу лиц (рамки, вероятности)", value=False)
+    videos = st.checkbox("🎬 Обрабатывать ролики (выборочные кадры)", value=False)
+    bursts = st.checkbox("📸 Серии снимков: не распознавать одно лицо на каждом кадре", value=False)
 
+if st.session_state["queue"] and st.button("🚀 Обработать всю очередь"):
+    jobs.submit(st.session_state["queue"], memory_budget_mb=memory_budget_mb or None, min_side=min_side, keep_faces=keep_faces, method=method, gallery=gallery or None, videos=videos, bursts=bursts)
     st.session_state["queue"] = []
+    st.rerun()
+
+STATUS_LABELS = {
+    QUEUED: "⏳ В очереди",
+    RUNNING: "🧠 Выполняется",
+    DONE: "✅ Готово",
+    FAILED: "❌ Ошибка",
+    CANCELLED: "⛔ Отменено",
+}
+
+def show_job(job):
+    icon = "↩️" if job.kind == UNDO else "📂"
+    st.markdown(f"### {icon} `{job.folder}` — {STATUS_LABELS[job.status]} ({int(job.elapsed)} с)")
+    if job.status == RUNNING:
+        event = job.progress.latest()
+        if event and event.get("total"):
+            st.progress(min(event["done"] / event["total"], 1.0), text=job.message)
+        elif event:
+            st.text(job.message)
+    if job.status == QUEUED or (job.status == RUNNING and job.kind != UNDO):
+        if st.button("⛔ Отменить", key=f"cancel_{job.id}"):
+            jobs.cancel(job.id)
+            st.rerun()
+    if job.error:
+        st.error(job.error)
+    for level, text in job.messages[:30]:
+        getattr(st, level)(text)
+    if job.result and job.kind == UNDO:
+        st.success(f"↩️ Возвращено файлов: {job.result['restored']}, удалено копий: {job.result['removed']}")
+    elif job.result:
+        result = job.result
+        st.success(f"✅ Готово. Перемещено: {result['moved']}, Скопировано и удалено оригиналов: {result['copied']}")
+        if result.get("names"):
+            st.info(f"👤 Узнано людей из галереи: {result['names']}")
+        if result.get("undone"):
+            st.info("↩️ Распределение отменено, файлы возвращены на место.")
+        elif result.get("undo_job"):
+            st.info("↩️ Откат распределения в очереди задач.")
+        elif st.button("↩️ Отменить распределение", key=f"undo_{job.id}"):
+            jobs.undo(job.id)
+            st.rerun()
+
+        if result["unreadable"]:
+            st.warning(f"📛 Нечитаемых файлов: {len(result['unreadable'])}")
+            st.code("\n".join(result["unreadable"][:30]))
+
+        if result["no_faces"]:
+            st.warning(f"🙈 Без лиц: {len(result['no_faces'])}")
+            st.code("\n".join(result["no_faces"][:30]))
+
+        if result["skipped_small"]:
+            st.info(f"🔍 Пропущено маленьких изображений: {len(result['skipped_small'])}")
+
+def show_jobs():
+    all_jobs = jobs.jobs()
+    if not all_jobs:
+        return
+    st.subheader("⚙️ Задачи")
+    if any(job.status in FINISHED for job in all_jobs) and st.button("🧹 Убрать завершённые"):
+        jobs.clear_finished()
+        st.rerun()
+    for job in all_jobs:
+        show_job(job)
+
+if hasattr(st, "fragment"):
+    # перерисовывается только панель задач, остальной UI не блокируется
+    st.fragment(run_every=2)(show_jobs)()
+else:
+    show_jobs()
+    if jobs.active():
+        time.sleep(2)
+        st.rerun()
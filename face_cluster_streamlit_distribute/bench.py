@@ -0,0 +1,197 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics import adjusted_rand_score
+
+from core.cluster import MICRO_RADIUS, cluster_scan, fit_labels, list_images, load_model, scan_images
+
+CONFIG_KEYS = {
+    "rec": "rec_model",
+    "intra": "intra_op_threads",
+    "inter": "inter_op_threads",
+    "opt": "graph_opt",
+    "mode": "execution_mode",
+}
+
+def parse_config(value):
+    # "buffalo_l" или "buffalo_l:rec=w600k_r50_int8.onnx,intra=4,opt=extended"
+    pack, _, rest = value.partition(":")
+    options = {"model_pack": pack or "buffalo_l"}
+    session = {}
+    for item in filter(None, rest.split(",")):
+        key, _, val = item.partition("=")
+        if key not in CONFIG_KEYS:
+            raise argparse.ArgumentTypeError(f"неизвестный параметр {key!r}, допустимы: {', '.join(CONFIG_KEYS)}")
+        name = CONFIG_KEYS[key]
+        if name == "rec_model":
+            options[name] = val
+        else:
+            session[name] = int(val) if name.endswith("_threads") else val
+    if session:
+        options.update({"intra_op_threads": 0, "inter_op_threads": 0, "graph_opt": "all", "execution_mode": "sequential", **session})
+    return value, options
+
+def image_labels(plan):
+    # метка изображения — его наименьший кластер, для сравнения разбиений между конфигурациями
+    return {entry["path"]: min(entry["cluster"]) for entry in plan.get("plan", [])}
+
+def agreement(base, other, images):
+    a = [base.get(str(p), -1) for p in images]
+    b = [other.get(str(p), -1) for p in images]
+    return adjusted_rand_score(a, b)
+
+def bench_models(args):
+    images = sorted(list_images(Path(args.folder)))
+    if args.limit:
+        images = images[:args.limit]
+    if not images:
+        sys.stderr.write("Нет изображений\n")
+        return 1
+
+    rows = []
+    baseline = None
+    for name, options in args.config:
+        started = time.perf_counter()
+        app = load_model(args.det_size, **options)
+        loaded = time.perf_counter()
+        scan = scan_images(images, app, workers=args.workers, batch_size=args.batch_size)
+        scanned = time.perf_counter()
+        plan = cluster_scan(images, scan, args.min_cluster_size, args.min_samples, args.min_prob)
+        labels = image_labels(plan)
+        if baseline is None:
+            baseline = labels
+        seconds = scanned - loaded
+        rows.append({
+            "config": name,
+            "load_s": round(loaded - started, 3),
+            "scan_s": round(seconds, 3),
+            "images_per_s": round(len(images) / seconds, 2) if seconds else None,
+            "faces": int(len(scan["embeddings"])),
+            "clusters": len(plan["clusters"]),
+            "ari_vs_first": round(agreement(baseline, labels, images), 4),
+        })
+
+    if args.json:
+        json.dump({"images": len(images), "results": rows}, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(f"Изображений: {len(images)}")
+        print(f"{'конфигурация':<48} {'загрузка,с':>10} {'скан,с':>9} {'изобр/с':>8} {'лиц':>6} {'класт':>6} {'ARI':>7}")
+        for r in rows:
+            print(f"{r['config']:<48} {r['load_s']:>10} {r['scan_s']:>9} {r['images_per_s']:>8} {r['faces']:>6} {r['clusters']:>6} {r['ari_vs_first']:>7}")
+    return 0
+
+def synthetic_faces(faces, identities, dim=512, spread=0.8, distractors=0.05, seed=0, chunk=100000):
+    # единичные векторы вокруг случайных центров; размеры «людей» по закону Ципфа, как в семейном архиве.
+    # spread — длина шума относительно центра (0.8 ≈ косинус 0.78 между лицами одного человека).
+    # Случайные одиночные лица (distractors) имеют истинную метку -1
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(identities, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    n_noise = int(faces * distractors)
+    weights = 1.0 / np.arange(1, identities + 1) ** 1.1
+    counts = rng.multinomial(faces - n_noise, weights / weights.sum())
+    truth = np.concatenate([np.repeat(np.arange(identities), counts), np.full(n_noise, -1)])
+    rng.shuffle(truth)
+
+    X = np.empty((faces, dim), dtype=np.float32)
+    for start in range(0, faces, chunk):
+        t = truth[start:start + chunk]
+        rows = rng.normal(scale=spread / np.sqrt(dim), size=(len(t), dim)).astype(np.float32)
+        known = t >= 0
+        rows[known] += centers[t[known]]
+        rows[~known] = rng.normal(size=(int((~known).sum()), dim))
+        X[start:start + chunk] = rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    return X, truth
+
+def final_labels(labels, probabilities, min_prob):
+    labels = np.asarray(labels).copy()
+    labels[np.asarray(probabilities) < min_prob] = -1
+    return labels
+
+def bench_cluster(args):
+    started = time.perf_counter()
+    X, truth = synthetic_faces(args.faces, args.identities, args.dim, args.spread, args.distractors, args.seed)
+    generated = time.perf_counter() - started
+
+    runs = []
+    if args.faces <= args.single_max:
+        runs.append(("hdbscan", {}))
+    for radius in args.micro_radius or [MICRO_RADIUS]:
+        runs.append((f"two-stage/r={radius}", {"method": "two-stage", "micro_radius": radius}))
+
+    rows = []
+    single = None
+    for name, options in runs:
+        t0 = time.perf_counter()
+        labels, probabilities, info = fit_labels(X, min_cluster_size=args.min_cluster_size, min_samples=args.min_samples, **options)
+        seconds = time.perf_counter() - t0
+        labels = final_labels(labels, probabilities, args.min_prob)
+        if name == "hdbscan":
+            single = labels
+        rows.append({
+            "method": name,
+            "seconds": round(seconds, 3),
+            "clusters": len(set(labels.tolist()) - {-1}),
+            "noise": round(float((labels == -1).mean()), 4),
+            "micro_clusters": info.get("micro_clusters"),
+            "ari_vs_truth": round(adjusted_rand_score(truth, labels), 4),
+            "ari_vs_single": round(adjusted_rand_score(single, labels), 4) if single is not None else None,
+        })
+
+    if args.json:
+        json.dump({"faces": args.faces, "identities": args.identities, "dim": args.dim, "generate_s": round(generated, 3), "results": rows}, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print(f"Лиц: {args.faces}, людей: {args.identities}, размерность: {args.dim}, генерация: {generated:.1f} с")
+        if single is None:
+            print(f"Одностадийный HDBSCAN пропущен (лиц больше --single-max {args.single_max})")
+        print(f"{'метод':<20} {'время,с':>9} {'класт':>7} {'шум':>7} {'микро':>8} {'ARI/истина':>11} {'ARI/HDBSCAN':>12}")
+        for r in rows:
+            print(f"{r['method']:<20} {r['seconds']:>9} {r['clusters']:>7} {r['noise']:>7} {str(r['micro_clusters'] or '-'):>8} {r['ari_vs_truth']:>11} {str(r['ari_vs_single'] if r['ari_vs_single'] is not None else '-'):>12}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Замеры производительности конвейера кластеризации")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    models = sub.add_parser("models", help="сравнить наборы моделей/настройки ONNX Runtime: скорость и согласие кластеризации")
+    models.add_argument("folder", help="папка с тестовыми фото")
+    models.add_argument("--config", type=parse_config, action="append", required=True,
+                        help="pack[:rec=файл.onnx,intra=N,inter=N,opt=all|extended|basic|disable,mode=sequential|parallel]; первая — эталон для ARI")
+    models.add_argument("--limit", type=int, help="взять первые N изображений")
+    models.add_argument("--det-size", type=lambda v: (int(v), int(v)), default=(1024, 1024))
+    models.add_argument("--workers", type=int, default=1)
+    models.add_argument("--batch-size", type=int, default=16)
+    models.add_argument("--min-cluster-size", type=int, default=3)
+    models.add_argument("--min-samples", type=int, default=1)
+    models.add_argument("--min-prob", type=float, default=0.85)
+    models.add_argument("--json", action="store_true", help="вывод в JSON")
+    models.set_defaults(func=bench_models)
+
+    cluster = sub.add_parser("cluster", help="одностадийный HDBSCAN против двухстадийного на синтетических эмбеддингах")
+    cluster.add_argument("--faces", type=int, default=1000000)
+    cluster.add_argument("--identities", type=int, default=5000)
+    cluster.add_argument("--dim", type=int, default=512)
+    cluster.add_argument("--spread", type=float, default=0.8, help="разброс лиц одного человека (длина шума)")
+    cluster.add_argument("--distractors", type=float, default=0.05, help="доля случайных одиночных лиц")
+    cluster.add_argument("--seed", type=int, default=0)
+    cluster.add_argument("--single-max", type=int, default=100000, help="одностадийный HDBSCAN только если лиц не больше N")
+    cluster.add_argument("--micro-radius", type=float, action="append", help="радиус микрокластера (можно несколько)")
+    cluster.add_argument("--min-cluster-size", type=int, default=3)
+    cluster.add_argument("--min-samples", type=int, default=1)
+    cluster.add_argument("--min-prob", type=float, default=0.85)
+    cluster.add_argument("--json", action="store_true", help="вывод в JSON")
+    cluster.set_defaults(func=bench_cluster)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,623 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from core.cluster import CLUSTER_METHODS, DBSCAN_EPS, MICRO_RADIUS, build_plan_live, list_images, load_model, renumber_clusters, scan_images
+from core.distribute import apply_journal, default_journal_path, distribute_to_folders, dry_run, undo_journal
+from core.media import FRAME_STRIDE
+from core.gallery import (
+    MATCH_THRESHOLD, add_identity, cluster_embeddings, empty_gallery, gallery_summary, largest_faces,
+    load_gallery, remove_identity, save_gallery,
+)
+from core.watch import POLL_INTERVAL, SETTLE_SECONDS, Observer, load_reference, watch_folder
+from core.progress import ProgressChannel
+from core.profiling import PROFILE_MODES, RunProfiler, profile_run_dir
+from core.planio import PLAN_SUFFIXES, convert_plan, load_embeddings, load_plan, plan_file_name, save_plan
+from core.review import MERGE_SIMILARITY, SPLIT_SPREAD, merge_clusters, suggest_merges, suggest_splits
+from core.runtime import EXECUTION_MODES, GRAPH_OPT_LEVELS, quantize_recognition
+from core.shards import merge_shards, scan_shard
+from core.sweep import SWEEP_EPS, SWEEP_MIN_CLUSTER_SIZES, SWEEP_MIN_PROBS, SWEEP_MIN_SAMPLES, load_sweep_embeddings, sweep_dbscan, sweep_hdbscan
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+class StderrProgress:
+    # получатель строк канала прогресса: перерисовывает одну строку stderr
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.width = 0
+
+    def text(self, message):
+        line = f"{self.prefix}{message}"
+        # строка короче предыдущей не должна оставлять хвост
+        sys.stderr.write(f"\r{line:<{self.width}}")
+        sys.stderr.flush()
+        self.width = max(self.width, len(line))
+
+def read_queue_file(path: Path):
+    folders = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                folders.append(line)
+    return folders
+
+def parse_part(value):
+    # "i/N" → (i, N), i считается с нуля
+    try:
+        i, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается i/N, получено {value!r}")
+    if n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"некорректная часть {value!r}: нужно 0 <= i < N")
+    return i, n
+
+def parse_det_size(value):
+    try:
+        size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается число, получено {value!r}")
+    return size, size
+
+def parse_list(kind):
+    # "2,3,5" → [2, 3, 5]
+    def parse(value):
+        try:
+            return [kind(x) for x in value.split(",") if x.strip()]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"ожидается список через запятую, получено {value!r}")
+    return parse
+
+def model_options(args):
+    options = {}
+    if args.model_pack != "buffalo_l":
+        options["model_pack"] = args.model_pack
+    if args.rec_model:
+        options["rec_model"] = args.rec_model
+    if args.intra_op_threads or args.inter_op_threads or args.graph_opt != "all" or args.execution_mode != "sequential":
+        options.update(
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+            graph_opt=args.graph_opt,
+            execution_mode=args.execution_mode,
+        )
+    return options
+
+def collect_folders(args):
+    folders = list(args.folders)
+    for queue_file in args.queue or []:
+        folders.extend(read_queue_file(Path(queue_file)))
+    seen = set()
+    unique = []
+    for folder in folders:
+        if folder not in seen:
+            seen.add(folder)
+            unique.append(folder)
+    if args.part:
+        i, n = args.part
+        unique = [folder for k, folder in enumerate(unique) if k % n == i]
+    return unique
+
+def write_plan(plan, path: Path, plan_dir: Path, fmt):
+    return save_plan(plan, plan_dir / plan_file_name(path.name, fmt))
+
+def finish_plan(plan, path: Path, args, cluster_offset, record, started):
+    cluster_count = renumber_clusters(plan, start=cluster_offset)
+    record["plan_file"] = str(write_plan(plan, path, Path(args.plan_dir), args.plan_format))
+
+    errors = []
+    moved, copied = 0, 0
+    if args.dry_run:
+        record["dry_run"] = dry_run(plan, path, args.keep_originals)
+    elif not args.no_distribute:
+        journal_path = default_journal_path(path)
+        record["journal"] = str(journal_path)
+        moved, copied = distribute_to_folders(plan, path, report=collect_errors(errors), journal_path=journal_path, keep_originals=args.keep_originals)
+
+    record.update({
+        "clusters": cluster_count,
+        "planned": len(plan.get("plan", [])),
+        "moved": moved,
+        "copied": copied,
+        "unreadable": len(plan.get("unreadable", [])),
+        "no_faces": len(plan.get("no_faces", [])),
+        "skipped_small": len(plan.get("skipped_small", [])),
+        "seconds": round(time.time() - started, 3),
+    })
+    if "faces" in plan:
+        record["faces"] = len(plan["faces"]["path"])
+    if "gallery" in plan:
+        record["gallery"] = plan["gallery"]
+        record["names"] = sorted(plan["names"].values())
+    if "memory" in plan:
+        record["memory"] = plan["memory"]
+    if "clustering" in plan:
+        record["clustering"] = plan["clustering"]
+    if "media" in plan:
+        record["media"] = plan["media"]
+    if errors:
+        record["errors"] = errors
+        if any(e["level"] == "error" for e in errors):
+            record["status"] = "partial"
+    return record, cluster_count
+
+def collect_errors(errors):
+    return lambda level, text: errors.append({"level": level, "message": text})
+
+def make_progress(args, label):
+    # события сканирования идут в очередь, stderr перерисовывается из своего потока не чаще REFRESH_INTERVAL
+    return None if args.quiet else ProgressChannel(StderrProgress(f"{label}: ").text)
+
+def end_progress(progress):
+    if progress:
+        progress.close()
+        if progress.shown:
+            sys.stderr.write("\n")
+
+def process_folder(folder, args, cluster_offset, gallery=None):
+    path = Path(folder)
+    record = {"folder": str(path), "status": "ok"}
+    if not path.exists():
+        record["status"] = "missing"
+        return record, 0
+
+    started = time.time()
+    progress = make_progress(args, path.name)
+    profiler = None
+    if args.profile:
+        profiler = RunProfiler(profile_run_dir(args.profile, path.name), args.profile_with or ())
+        record["profile"] = str(profiler.run_dir)
+    try:
+        plan = build_plan_live(
+            path,
+            det_size=args.det_size,
+            min_cluster_size=args.min_cluster_size,
+            min_samples=args.min_samples,
+            min_prob_threshold=args.min_prob,
+            progress_callback=progress,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            memory_budget_mb=args.memory_budget_mb,
+            spill_dir=args.spill_dir,
+            model_options=model_options(args),
+            min_side=args.min_side,
+            max_side=args.max_side,
+            keep_faces=args.keep_faces,
+            keep_embeddings=args.keep_embeddings,
+            method=args.method,
+            micro_radius=args.micro_radius,
+            gallery=gallery,
+            match_threshold=args.match_threshold,
+            eps=args.eps,
+            largest_face=args.largest_face,
+            profiler=profiler,
+            videos=args.videos,
+            video_stride=args.video_stride,
+            bursts=args.bursts,
+        )
+    finally:
+        end_progress(progress)
+    return finish_plan(plan, path, args, cluster_offset, record, started)
+
+def emit(record, fmt):
+    if fmt == "ndjson":
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+def open_gallery(args):
+    return load_gallery(Path(args.gallery)) if args.gallery else None
+
+def check_keep_embeddings(args):
+    if args.keep_embeddings and args.plan_format != "npz":
+        sys.stderr.write("--keep-embeddings сохраняется только в план формата npz\n")
+        return False
+    return True
+
+def cmd_run(args):
+    if not check_keep_embeddings(args):
+        return EXIT_USAGE
+    folders = collect_folders(args)
+    if not folders:
+        sys.stderr.write("Нет папок для обработки\n")
+        return EXIT_USAGE
+
+    gallery = open_gallery(args)
+    results = []
+    cluster_offset = args.cluster_offset
+    for folder in folders:
+        try:
+            record, cluster_count = process_folder(folder, args, cluster_offset, gallery)
+            cluster_offset += cluster_count
+        except Exception as e:
+            record = {"folder": folder, "status": "error", "error": f"{type(e).__name__}: {e}"}
+        emit(record, args.output)
+        results.append(record)
+
+    if args.output == "json":
+        json.dump({"results": results}, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+
+    return EXIT_OK if all(r["status"] == "ok" for r in results) else EXIT_FAILED
+
+def cmd_scan(args):
+    path = Path(args.folder)
+    if not path.exists():
+        sys.stderr.write(f"Путь не существует: {path}\n")
+        return EXIT_FAILED
+    index, count = args.shard
+    out = Path(args.out or f"shard_{path.name}_{index}of{count}.npz")
+    progress = make_progress(args, f"{path.name} [{index}/{count}]")
+    meta = scan_shard(
+        path, out, index, count, det_size=args.det_size, progress_callback=progress,
+        workers=args.workers, batch_size=args.batch_size, model_options=model_options(args),
+        min_side=args.min_side, max_side=args.max_side, largest_face=args.largest_face,
+        videos=args.videos, video_stride=args.video_stride, bursts=args.bursts,
+    )
+    end_progress(progress)
+    emit({"status": "ok", "shard_file": str(out), **meta}, "ndjson")
+    return EXIT_OK
+
+def cmd_merge(args):
+    if not check_keep_embeddings(args):
+        return EXIT_USAGE
+    started = time.time()
+    progress = make_progress(args, "merge")
+    try:
+        plan, root = merge_shards(
+            args.shards, args.root, args.min_cluster_size, args.min_samples, args.min_prob,
+            memory_budget_mb=args.memory_budget_mb, spill_dir=args.spill_dir, progress_callback=progress,
+            keep_faces=args.keep_faces, keep_embeddings=args.keep_embeddings,
+            method=args.method, micro_radius=args.micro_radius,
+            gallery=open_gallery(args), match_threshold=args.match_threshold, eps=args.eps,
+        )
+    except (ValueError, OSError, MemoryError) as e:
+        end_progress(progress)
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    end_progress(progress)
+    record = {"folder": str(root), "status": "ok", "shards": len(args.shards)}
+    record, _ = finish_plan(plan, root, args, args.cluster_offset, record, started)
+    emit(record, "ndjson")
+    return EXIT_OK if record["status"] == "ok" else EXIT_FAILED
+
+def cmd_distribute(args):
+    plan = load_plan(Path(args.plan))
+    base_dir = Path(args.base_dir)
+    if args.dry_run:
+        emit({"status": "ok", "plan_file": args.plan, "dry_run": dry_run(plan, base_dir, args.keep_originals)}, "ndjson")
+        return EXIT_OK
+    errors = []
+    journal_path = default_journal_path(base_dir)
+    moved, copied = distribute_to_folders(plan, base_dir, report=collect_errors(errors), journal_path=journal_path, keep_originals=args.keep_originals)
+    return emit_journal_result({"plan_file": args.plan, "journal": str(journal_path), "moved": moved, "copied": copied}, errors)
+
+def cmd_resume(args):
+    errors = []
+    moved, copied = apply_journal(Path(args.journal), report=collect_errors(errors))
+    return emit_journal_result({"journal": args.journal, "moved": moved, "copied": copied}, errors)
+
+def cmd_undo(args):
+    errors = []
+    restored, removed = undo_journal(Path(args.journal), report=collect_errors(errors))
+    return emit_journal_result({"journal": args.journal, "restored": restored, "removed_copies": removed}, errors)
+
+def emit_journal_result(record, errors):
+    record = {"status": "partial" if errors else "ok", **record}
+    if errors:
+        record["errors"] = errors
+    emit(record, "ndjson")
+    return EXIT_FAILED if errors else EXIT_OK
+
+def cmd_convert(args):
+    started = time.time()
+    dst = convert_plan(Path(args.src), Path(args.dst), indent=args.indent)
+    emit({"status": "ok", "plan_file": str(dst), "seconds": round(time.time() - started, 3)}, "ndjson")
+    return EXIT_OK
+
+def cmd_gallery_add(args):
+    path = Path(args.gallery)
+    gallery = load_gallery(path) if path.exists() else empty_gallery()
+    embeddings = []
+    try:
+        if args.plan:
+            if args.cluster is None:
+                sys.stderr.write("--plan требует --cluster\n")
+                return EXIT_USAGE
+            embeddings.append(cluster_embeddings(load_plan(Path(args.plan)), load_embeddings(Path(args.plan)), args.cluster))
+        if args.folders:
+            images = [p for folder in args.folders for p in sorted(list_images(Path(folder)))]
+            progress = make_progress(args, args.name)
+            app = load_model(args.det_size, **model_options(args))
+            scan = scan_images(images, app, progress, args.workers, args.batch_size, min_side=args.min_side, max_side=args.max_side)
+            end_progress(progress)
+            if len(scan["embeddings"]):
+                embeddings.append(largest_faces(scan))
+        if not embeddings:
+            sys.stderr.write("Укажите папки с фото человека или --plan/--cluster\n")
+            return EXIT_USAGE
+        added = sum(len(e) for e in embeddings)
+        gallery = add_identity(gallery, args.name, [row for e in embeddings for row in e])
+    except ValueError as e:
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    save_gallery(gallery, path)
+    entry = next(e for e in gallery_summary(gallery) if e["name"] == args.name.strip())
+    emit({"status": "ok", "gallery": str(path), "added_faces": added, **entry}, "ndjson")
+    return EXIT_OK
+
+def cmd_gallery_list(args):
+    for entry in gallery_summary(load_gallery(Path(args.gallery))):
+        emit(entry, "ndjson")
+    return EXIT_OK
+
+def cmd_gallery_remove(args):
+    path = Path(args.gallery)
+    try:
+        gallery = remove_identity(load_gallery(path), args.name)
+    except KeyError:
+        emit({"status": "error", "error": f"в галерее нет {args.name!r}"}, "ndjson")
+        return EXIT_FAILED
+    save_gallery(gallery, path)
+    emit({"status": "ok", "gallery": str(path), "removed": args.name}, "ndjson")
+    return EXIT_OK
+
+def cmd_watch(args):
+    folder = Path(args.folder)
+    if not folder.is_dir():
+        sys.stderr.write(f"Путь не существует: {folder}\n")
+        return EXIT_FAILED
+    scan_options = dict(workers=args.workers, batch_size=args.batch_size, min_side=args.min_side, max_side=args.max_side)
+    progress = make_progress(args, folder.name)
+    # модель загружается один раз и остаётся в памяти на всё время наблюдения
+    app = load_model(args.det_size, **model_options(args))
+    try:
+        reference = load_reference(folder, app, args.plan, open_gallery(args), args.rebuild_reference, progress, **scan_options)
+    except ValueError as e:
+        end_progress(progress)
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    end_progress(progress)
+    if not reference["names"]:
+        sys.stderr.write("Нет кластеров для сравнения: сначала разложите папку командой run или укажите --gallery/--plan\n")
+        return EXIT_USAGE
+    emit({"status": "watching", "folder": str(folder), "clusters": len(reference["names"]), "watchdog": Observer is not None}, "ndjson")
+
+    errors = []
+
+    def on_batch(result):
+        emit_journal_result(result, list(errors))
+        errors.clear()
+
+    try:
+        watch_folder(
+            folder, app, reference, on_batch, match_threshold=args.match_threshold, settle=args.settle,
+            interval=args.interval, include_existing=args.include_existing, report=collect_errors(errors), **scan_options,
+        )
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+def cmd_sweep(args):
+    started = time.time()
+    try:
+        X = load_sweep_embeddings(args.sources)
+    except ValueError as e:
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    if len(X) < 2:
+        emit({"status": "error", "error": "меньше двух лиц — подбирать нечего"}, "ndjson")
+        return EXIT_FAILED
+    progress = make_progress(args, "sweep")
+    try:
+        if args.method == "dbscan":
+            rows = sweep_dbscan(X, args.eps, args.min_samples or [2], args.min_cluster_size, progress)
+        else:
+            rows = sweep_hdbscan(X, args.min_cluster_size, args.min_samples or list(SWEEP_MIN_SAMPLES), args.min_prob, args.exact, progress)
+    except RuntimeError as e:
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    finally:
+        end_progress(progress)
+    for row in rows:
+        emit(row, "ndjson")
+    emit({"status": "ok", "faces": int(len(X)), "settings": len(rows), "seconds": round(time.time() - started, 3)}, "ndjson")
+    return EXIT_OK
+
+def cmd_review(args):
+    path = Path(args.plan)
+    try:
+        plan = load_plan(path)
+        embeddings = load_embeddings(path)
+        merges = suggest_merges(plan, embeddings, args.merge_threshold)
+        groups = list(args.merge or [])
+        if args.merge_suggested:
+            groups += [s["clusters"] for s in merges]
+        if not groups:
+            # только предложения: оператор выбирает, что объединить, и запускает review ещё раз с --merge
+            for suggestion in merges:
+                emit({"suggestion": "merge", **suggestion}, "ndjson")
+            for suggestion in suggest_splits(plan, embeddings, args.split_spread):
+                emit({"suggestion": "split", **suggestion}, "ndjson")
+            return EXIT_OK
+        mapping = merge_clusters(plan, groups)
+    except ValueError as e:
+        emit({"status": "error", "error": str(e)}, "ndjson")
+        return EXIT_FAILED
+    if embeddings is not None:
+        plan["embeddings"] = embeddings
+    out = save_plan(plan, Path(args.out) if args.out else path)
+    emit({"status": "ok", "plan_file": str(out), "merged": {str(k): v for k, v in sorted(mapping.items())}, "clusters": len(plan["clusters"])}, "ndjson")
+    return EXIT_OK
+
+def cmd_quantize(args):
+    dst = quantize_recognition(Path(args.src), Path(args.dst))
+    emit({"status": "ok", "rec_model": str(dst)}, "ndjson")
+    return EXIT_OK
+
+def add_model_args(parser):
+    parser.add_argument("--model-pack", default="buffalo_l", help="набор моделей insightface (buffalo_l, buffalo_s, ...)")
+    parser.add_argument("--rec-model", help="свой .onnx распознавания, например INT8 из cli.py quantize")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="потоков ONNX Runtime внутри оператора (0 — по умолчанию)")
+    parser.add_argument("--inter-op-threads", type=int, default=0, help="потоков ONNX Runtime между операторами (0 — по умолчанию)")
+    parser.add_argument("--graph-opt", choices=sorted(GRAPH_OPT_LEVELS), default="all", help="уровень оптимизации графа")
+    parser.add_argument("--execution-mode", choices=sorted(EXECUTION_MODES), default="sequential")
+
+def add_scan_args(parser):
+    parser.add_argument("--det-size", type=parse_det_size, default=(1024, 1024))
+    parser.add_argument("--workers", type=int, default=1, help="потоков декодирования изображений")
+    parser.add_argument("--batch-size", type=int, default=16, help="сколько изображений декодировать наперёд")
+    parser.add_argument("--min-side", type=int, default=0, help="пропускать без декодирования изображения с меньшей стороной меньше N пикселей")
+    parser.add_argument("--max-side", type=int, help="декодировать большие JPEG с уменьшением в 2/4/8 раз, пока длинная сторона не меньше N")
+    add_model_args(parser)
+
+def add_media_args(parser):
+    parser.add_argument("--videos", action="store_true", help="обрабатывать и ролики: выборочные кадры, по одному лицу на человека")
+    parser.add_argument("--video-stride", type=float, default=FRAME_STRIDE, help="секунд между выборочными кадрами ролика")
+    parser.add_argument("--bursts", action="store_true", help="серии снимков: лица, продолжающие лицо предыдущего кадра, не распознаются заново")
+
+def add_cluster_args(parser):
+    parser.add_argument("--plan-dir", default=".", help="куда писать plan_<папка>.<формат>")
+    parser.add_argument("--plan-format", choices=sorted(PLAN_SUFFIXES), default="npz", help="npz — компактный бинарный, ndjson — потоковый, json — прежний")
+    parser.add_argument("--no-distribute", action="store_true", help="только построить план, файлы не трогать")
+    parser.add_argument("--dry-run", action="store_true", help="не трогать файлы, вывести объём перемещений/копирований по томам")
+    parser.add_argument("--cluster-offset", type=int, default=1, help="начальный номер кластера")
+    parser.add_argument("--min-cluster-size", type=int, default=3)
+    parser.add_argument("--min-samples", type=int, default=1)
+    parser.add_argument("--min-prob", type=float, default=0.85)
+    parser.add_argument("--keep-originals", action="store_true", help="только копировать в cluster_N, исходные файлы оставить на месте")
+    parser.add_argument("--method", choices=CLUSTER_METHODS, default="hdbscan", help="two-stage — микрокластеры k-means, затем HDBSCAN по центрам (сотни тысяч лиц); dbscan — один порог --eps")
+    parser.add_argument("--eps", type=float, default=DBSCAN_EPS, help="для dbscan: максимальное косинусное расстояние между соседями")
+    parser.add_argument("--micro-radius", type=float, default=MICRO_RADIUS, help="для two-stage: радиус микрокластера (меньше — точнее и медленнее)")
+    parser.add_argument("--memory-budget-mb", type=int, help="бюджет памяти: float16-эмбеддинги на диске, при превышении — приближённая кластеризация")
+    parser.add_argument("--spill-dir", help="каталог для временного файла эмбеддингов (по умолчанию системный temp)")
+    parser.add_argument("--gallery", help="галерея известных людей (.npz): их лица раскладываются по папкам с именами, кластеризуется только остаток")
+    parser.add_argument("--match-threshold", type=float, default=MATCH_THRESHOLD, help="минимальный косинус к человеку из галереи")
+    parser.add_argument("--keep-faces", action="store_true", help="сохранить в плане таблицу лиц: рамка, уверенность детектора, кластер, вероятность")
+    parser.add_argument("--keep-embeddings", action="store_true", help="вместе с таблицей лиц сохранить эмбеддинги float16 (только --plan-format npz)")
+    parser.add_argument("--quiet", action="store_true", help="не выводить прогресс в stderr")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Кластеризация лиц без UI (cron/systemd)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="кластеризовать папки и разложить по cluster_N")
+    run.add_argument("folders", nargs="*", help="папки с фото")
+    run.add_argument("--queue", action="append", help="файл очереди: одна папка на строку, # — комментарий")
+    run.add_argument("--part", type=parse_part, help="обработать только часть очереди i/N (для нескольких машин)")
+    run.add_argument("--output", choices=["json", "ndjson"], default="ndjson", help="формат вывода в stdout")
+    add_cluster_args(run)
+    add_scan_args(run)
+    run.add_argument("--largest-face", action="store_true", help="с каждого фото — только самое крупное лицо (портреты)")
+    add_media_args(run)
+    run.add_argument("--profile", help="папка для профиля: <папка>/<имя>-<время>/timers.json с временем стадий")
+    run.add_argument("--profile-with", action="append", choices=PROFILE_MODES, help="дополнительно: sample — стеки для flame graph, cprofile — profile.pstats, onnx — профиль ONNX Runtime")
+    run.set_defaults(func=cmd_run)
+
+    scan = sub.add_parser("scan", help="просканировать шард i/N папки и сохранить эмбеддинги")
+    scan.add_argument("folder", help="папка с фото (общая для всех узлов)")
+    scan.add_argument("--shard", type=parse_part, default=(0, 1), help="номер шарда i/N, i с нуля")
+    scan.add_argument("--out", help="файл шарда .npz")
+    scan.add_argument("--quiet", action="store_true", help="не выводить прогресс в stderr")
+    add_scan_args(scan)
+    scan.add_argument("--largest-face", action="store_true", help="с каждого фото — только самое крупное лицо (портреты)")
+    add_media_args(scan)
+    scan.set_defaults(func=cmd_scan)
+
+    merge = sub.add_parser("merge", help="объединить шарды и один раз кластеризовать")
+    merge.add_argument("shards", nargs="+", help="файлы шардов .npz")
+    merge.add_argument("--root", help="путь к папке на этом узле, если отличается от пути при сканировании")
+    add_cluster_args(merge)
+    merge.set_defaults(func=cmd_merge)
+
+    distribute = sub.add_parser("distribute", help="разложить файлы по готовому плану (с журналом)")
+    distribute.add_argument("plan", help="plan_<папка>.npz / .ndjson / .json")
+    distribute.add_argument("base_dir", help="папка, в которой создаются cluster_N")
+    distribute.add_argument("--dry-run", action="store_true", help="только статистика по томам")
+    distribute.add_argument("--keep-originals", action="store_true", help="только копировать, исходные файлы оставить на месте")
+    distribute.set_defaults(func=cmd_distribute)
+
+    resume = sub.add_parser("resume", help="довыполнить прерванное распределение по журналу")
+    resume.add_argument("journal", help="файл журнала из <папка>/.distribute_journal/")
+    resume.set_defaults(func=cmd_resume)
+
+    undo = sub.add_parser("undo", help="откатить распределение по журналу")
+    undo.add_argument("journal", help="файл журнала из <папка>/.distribute_journal/")
+    undo.set_defaults(func=cmd_undo)
+
+    convert = sub.add_parser("convert", help="преобразовать план между форматами (.npz / .ndjson / .json)")
+    convert.add_argument("src")
+    convert.add_argument("dst")
+    convert.add_argument("--indent", type=int, help="отступ для .json (как раньше — 2)")
+    convert.set_defaults(func=cmd_convert)
+
+    sweep = sub.add_parser("sweep", help="подобрать параметры кластеризации по сохранённым эмбеддингам, без повторного сканирования")
+    sweep.add_argument("sources", nargs="+", help="планы .npz с --keep-embeddings или шарды .npz")
+    sweep.add_argument("--method", choices=("hdbscan", "dbscan"), default="hdbscan")
+    sweep.add_argument("--min-cluster-size", type=parse_list(int), default=list(SWEEP_MIN_CLUSTER_SIZES), help="значения через запятую")
+    sweep.add_argument("--min-samples", type=parse_list(int), help="значения через запятую (по умолчанию 1,2,3; для dbscan — 2)")
+    sweep.add_argument("--min-prob", type=parse_list(float), default=list(SWEEP_MIN_PROBS), help="для hdbscan: пороги вероятности через запятую")
+    sweep.add_argument("--eps", type=parse_list(float), default=list(SWEEP_EPS), help="для dbscan: значения eps через запятую")
+    sweep.add_argument("--exact", action="store_true", help="для hdbscan: дерево по всем парам, как в run, а не по графу ближайших соседей (медленнее)")
+    sweep.add_argument("--quiet", action="store_true", help="не выводить прогресс в stderr")
+    sweep.set_defaults(func=cmd_sweep)
+
+    review = sub.add_parser("review", help="предложить объединения и разделения кластеров и применить объединения к плану")
+    review.add_argument("plan", help="план .npz, построенный с --keep-embeddings")
+    review.add_argument("--merge-threshold", type=float, default=MERGE_SIMILARITY, help="минимальный косинус между центрами кластеров для предложения объединить")
+    review.add_argument("--split-spread", type=float, default=SPLIT_SPREAD, help="средний разброс лиц кластера, выше которого предлагается разделить")
+    review.add_argument("--merge", action="append", type=parse_list(int), help="объединить кластеры, например 3,7 (можно повторять)")
+    review.add_argument("--merge-suggested", action="store_true", help="объединить все предложенные пары")
+    review.add_argument("--out", help="куда сохранить план с объединениями (по умолчанию — поверх исходного)")
+    review.set_defaults(func=cmd_review)
+
+    quantize = sub.add_parser("quantize", help="INT8-квантизация модели распознавания (.onnx)")
+    quantize.add_argument("src", help="исходная модель, например ~/.insightface/models/buffalo_l/w600k_r50.onnx")
+    quantize.add_argument("dst", help="куда сохранить квантованную модель")
+    quantize.set_defaults(func=cmd_quantize)
+
+    watch = sub.add_parser("watch", help="следить за папкой и сразу раскладывать новые фото по существующим кластерам")
+    watch.add_argument("folder", help="папка, уже разложенная командой run (в ней есть cluster_N)")
+    watch.add_argument("--plan", help="образцы кластеров из плана с --keep-embeddings вместо сканирования папок cluster_N")
+    watch.add_argument("--gallery", help="галерея известных людей: их фото — в папки с именами")
+    watch.add_argument("--match-threshold", type=float, default=MATCH_THRESHOLD, help="минимальный косинус к кластеру; менее похожие фото остаются на месте")
+    watch.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="секунд без изменений размера и mtime, после которых файл считается дописанным")
+    watch.add_argument("--interval", type=float, default=POLL_INTERVAL, help="период опроса папки, с")
+    watch.add_argument("--include-existing", action="store_true", help="разобрать и фото, лежавшие в папке до запуска")
+    watch.add_argument("--rebuild-reference", action="store_true", help="пересканировать папки кластеров, не используя кэш образцов")
+    watch.add_argument("--quiet", action="store_true", help="не выводить прогресс в stderr")
+    add_scan_args(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    gallery = sub.add_parser("gallery", help="галерея известных людей для --gallery")
+    gallery_sub = gallery.add_subparsers(dest="gallery_command", required=True)
+
+    gallery_add = gallery_sub.add_parser("add", help="добавить человека (или новые фото уже известного)")
+    gallery_add.add_argument("gallery", help="файл галереи .npz (создаётся, если нет)")
+    gallery_add.add_argument("name", help="имя — так будет называться папка")
+    gallery_add.add_argument("folders", nargs="*", help="папки с фото человека: с каждого фото берётся самое крупное лицо")
+    gallery_add.add_argument("--plan", help="или план, построенный с --keep-embeddings...")
+    gallery_add.add_argument("--cluster", type=int, help="...и номер кластера в нём")
+    gallery_add.add_argument("--quiet", action="store_true", help="не выводить прогресс в stderr")
+    add_scan_args(gallery_add)
+    gallery_add.set_defaults(func=cmd_gallery_add)
+
+    gallery_list = gallery_sub.add_parser("list", help="список людей в галерее")
+    gallery_list.add_argument("gallery")
+    gallery_list.set_defaults(func=cmd_gallery_list)
+
+    gallery_remove = gallery_sub.add_parser("remove", help="удалить человека из галереи")
+    gallery_remove.add_argument("gallery")
+    gallery_remove.add_argument("name")
+    gallery_remove.set_defaults(func=cmd_gallery_remove)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+from facecluster.distribute import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.gallery import *  # noqa: F401,F403
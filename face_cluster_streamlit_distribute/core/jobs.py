@@ -0,0 +1 @@
+from facecluster.jobs import *  # noqa: F401,F403
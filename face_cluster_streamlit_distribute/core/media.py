@@ -0,0 +1 @@
+from facecluster.media import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.planio import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.profiling import *  # noqa: F401,F403
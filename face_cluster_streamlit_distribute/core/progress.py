@@ -0,0 +1 @@
+from facecluster.progress import *  # noqa: F401,F403
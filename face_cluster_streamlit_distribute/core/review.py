@@ -0,0 +1 @@
+from facecluster.review import *  # noqa: F401,F403
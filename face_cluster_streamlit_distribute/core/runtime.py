@@ -0,0 +1 @@
+from facecluster.runtime import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.shards import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.sweep import *  # noqa: F401,F403
@@ -0,0 +1 @@
+from facecluster.watch import *  # noqa: F401,F403
@@ -0,0 +1,2 @@
+# общий код всех приложений: чтение → детектор → эмбеддер → кластеризация → план → распределение.
+# Точка входа — facecluster.pipeline.Pipeline; тяжёлые зависимости (insightface, hdbscan) грузятся при импорте модулей
@@ -0,0 +1,460 @@
+import os
+import tempfile
+import uuid
+import cv2
+import numpy as np
+from pathlib import Path
+from sklearn.cluster import DBSCAN
+from sklearn.preprocessing import normalize
+try:
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo import model_zoo
+except ImportError:  # без insightface работают планы, кластеризация и свой детектор (app=...), но не load_model
+    FaceAnalysis = model_zoo = None
+import hdbscan
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from facecluster.memory import EmbeddingSpill, PREDICT_CHUNK, estimate_hdbscan_mb, rows_within_budget
+from facecluster.runtime import DEFAULT_MODULES, apply_session_options, session_options
+from facecluster.header import REDUCED_FLAGS, apply_orientation, read_header, reduce_factor
+from facecluster.twostage import MICRO_RADIUS, fit_two_stage
+from facecluster.gallery import MATCH_THRESHOLD, match_faces
+from facecluster.profiling import timed
+from facecluster.progress import as_progress
+from facecluster.media import FRAME_STRIDE, FaceTracker, is_video, same_burst, scan_video
+
+IMG_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+EMBEDDING_DIM = 512
+# two-stage: k-means на микрокластеры, HDBSCAN по их центрам — для библиотек в сотни тысяч лиц;
+# dbscan — алгоритм первых версий приложения с одним порогом eps
+CLUSTER_METHODS = ("hdbscan", "two-stage", "dbscan")
+DBSCAN_EPS = 0.5  # косинусное расстояние
+
+try:
+    cv2.setLogLevel(cv2.LOG_LEVEL_ERROR)
+except AttributeError:
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+def is_image(p: Path) -> bool:
+    return p.suffix.lower() in IMG_EXTS
+
+def _win_long(path: Path) -> str:
+    p = str(path.resolve())
+    if os.name != "nt":
+        return p
+    return "\\\\?\\" + p if not p.startswith("\\\\?\\") else p
+
+HEADER_UNREAD = object()  # заголовок ещё не читали; None — читали, но Pillow его не разобрал
+
+def imread_safe(path: Path, header=HEADER_UNREAD, max_side=None):
+    # поворот по EXIF применяем сами: OpenCV делает это не во всех версиях и не для imdecode
+    if header is HEADER_UNREAD:
+        header = read_header(_win_long(path))
+    try:
+        data = np.fromfile(_win_long(path), dtype=np.uint8)
+        if data.size == 0:
+            return None
+        flags = REDUCED_FLAGS.get(reduce_factor(header, max_side), cv2.IMREAD_COLOR)
+        if header is not None:
+            # поворот применяем сами; без заголовка (нет Pillow, формат не по силам Pillow) — поворачивает OpenCV
+            flags |= cv2.IMREAD_IGNORE_ORIENTATION
+        img = cv2.imdecode(data, flags)
+        if img is not None and header is not None:
+            img = apply_orientation(img, header["orientation"])
+        return img
+    except Exception:
+        return None
+
+def load_image(path: Path, min_side=0, max_side=None, timers=None):
+    # (img, header, small): маленькие картинки и скриншоты отсекаются по заголовку, без декодирования
+    with timed(timers, "header"):
+        header = read_header(_win_long(path))
+    if header and min_side and min(header["width"], header["height"]) < min_side:
+        return None, header, True
+    with timed(timers, "decode"):
+        img = imread_safe(path, header, max_side)
+    return img, header, False
+
+def iter_decoded(paths, workers=1, batch_size=16, min_side=0, max_side=None, timers=None):
+    # декодирование в потоках: cv2.imdecode отпускает GIL, детектор в это время занят предыдущим кадром.
+    # decode.wait — сколько основной поток простаивал в ожидании кадра: если почти 0, потоков хватает
+    if workers <= 1:
+        for p in paths:
+            with timed(timers, "decode.wait"):
+                loaded = load_image(p, min_side, max_side, timers)
+            yield (p, *loaded)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        it = iter(paths)
+        pending = deque()
+        for p in it:
+            pending.append((p, pool.submit(load_image, p, min_side, max_side, timers)))
+            if len(pending) >= max(batch_size, workers):
+                break
+        while pending:
+            p, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(load_image, nxt, min_side, max_side, timers)))
+            with timed(timers, "decode.wait"):
+                loaded = fut.result()
+            yield (p, *loaded)
+
+def list_images(input_dir: Path, videos=False):
+    return [p for p in Path(input_dir).rglob("*") if is_image(p) or (videos and is_video(p))]
+
+def load_model(det_size=(1024, 1024), model_pack="buffalo_l", rec_model=None, modules=DEFAULT_MODULES, providers=None, **session):
+    # session: intra_op_threads, inter_op_threads, graph_opt, execution_mode — см. facecluster.runtime.session_options
+    if FaceAnalysis is None:
+        raise ImportError("для детекции лиц нужен insightface: pip install insightface")
+    providers = providers or ["CPUExecutionProvider"]
+    app = FaceAnalysis(name=model_pack, providers=providers, allowed_modules=list(modules) if modules else None)
+    if rec_model:
+        # например, INT8-квантованная модель распознавания (cli.py quantize)
+        app.models["recognition"] = model_zoo.get_model(str(rec_model), providers=providers)
+    if session:
+        apply_session_options(app, session_options(**session), providers)
+    app.prepare(ctx_id=0, det_size=det_size)
+    return app
+
+def face_area(f):
+    return float((f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+def scan_images(all_images, app, progress_callback=None, workers=1, batch_size=16, cancel_event=None, spill=None, min_side=0, max_side=None, largest_face=False, timers=None, bursts=False, video_stride=FRAME_STRIDE):
+    embeddings = []
+    owners = []
+    bboxes = []
+    det_scores = []
+    unreadable = []
+    no_faces = []
+    skipped_small = []
+    headers = {}
+    # событие на каждое фото дёшево: до экрана доходит не больше REFRESH_INTERVAL перерисовок
+    progress = as_progress(progress_callback)
+    videos = [p for p in all_images if is_video(p)]
+    images = [p for p in all_images if not is_video(p)]
+    media = {}
+    tracker = None
+    if bursts:
+        # серия снимков идёт подряд по именам файлов; лица, перекрывающие лица предыдущего кадра серии,
+        # не распознаются заново
+        images = sorted(images)
+        tracker = FaceTracker(app)
+        previous = (None, None)
+
+    def add_faces(p, faces, scale):
+        faces = [f for f in faces if getattr(f, "normed_embedding", None) is not None]
+        if largest_face and faces:
+            # портреты: одно фото — один человек, случайные лица на фоне не попадают в кластеры
+            faces = [max(faces, key=face_area)]
+        for f in faces:
+            emb = np.asarray(f.normed_embedding, dtype=np.float32).reshape(1, -1)
+            emb = normalize(emb, norm='l2')[0]
+            if spill is not None:
+                spill.append(emb)
+            else:
+                embeddings.append(emb)
+            owners.append(p)
+            bboxes.append(np.asarray(f.bbox, dtype=np.float32) * scale)
+            det_scores.append(float(getattr(f, "det_score", 0.0)))
+
+    for i, (p, img, header, small) in enumerate(iter_decoded(images, workers, batch_size, min_side, max_side, timers)):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled(f"остановлено на {i}/{len(all_images)}")
+        if progress and i:
+            progress.update("scan", i, len(all_images), faces=len(owners))
+        if header:
+            headers[p] = header
+        if small:
+            skipped_small.append(p)
+            continue
+        if img is None:
+            unreadable.append(p)
+            continue
+        with timed(timers, "app.get"):
+            if tracker is not None:
+                if not same_burst(*previous, p, header):
+                    tracker.reset()
+                previous = (p, header)
+                faces = tracker.step(img)
+            else:
+                faces = app.get(img)
+        if not faces:
+            no_faces.append(p)
+            continue
+        # bbox — в координатах исходного (повёрнутого по EXIF) изображения, даже если декодировали с уменьшением
+        add_faces(p, faces, max(header["width"], header["height"]) / max(img.shape[:2]) if header else 1.0)
+    if tracker is not None:
+        # сколько лиц найдено на снимках серий и сколько из них пришлось распознавать
+        media.update(burst_faces=tracker.faces, burst_embedded=tracker.embedded)
+
+    # ролики: выборочные кадры, треки лиц, по лицу на человека; bbox — в координатах кадра
+    for i, p in enumerate(videos, start=len(images)):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled(f"остановлено на {i}/{len(all_images)}")
+        if progress and i:
+            progress.update("scan", i, len(all_images), faces=len(owners))
+        with timed(timers, "video"):
+            found = scan_video(p, app, video_stride, max_side=max_side)
+        if found is None:
+            unreadable.append(p)
+            continue
+        for key in ("frames", "tracks", "embedded"):
+            media[f"video_{key}"] = media.get(f"video_{key}", 0) + found[key]
+        if not found["faces"]:
+            no_faces.append(p)
+            continue
+        add_faces(p, found["faces"], 1.0)
+
+    if progress and all_images:
+        progress.update("scan", len(all_images), len(all_images), faces=len(owners))
+
+    if spill is not None:
+        X = spill.finish()
+    else:
+        X = np.vstack(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    result = {
+        "embeddings": X,
+        "owners": owners,
+        "bboxes": np.vstack(bboxes) if bboxes else np.zeros((0, 4), dtype=np.float32),
+        "det_scores": np.asarray(det_scores, dtype=np.float32),
+        "unreadable": unreadable,
+        "no_faces": no_faces,
+        "skipped_small": skipped_small,
+        "headers": headers,
+    }
+    if videos:
+        media["videos"] = len(videos)
+    if media:
+        result["media"] = media
+    return result
+
+def fit_hdbscan(X, min_cluster_size=3, min_samples=1, memory_budget_mb=None, progress_callback=None, seed=0):
+    n, dim = X.shape
+    projected = estimate_hdbscan_mb(n, dim)
+    info = {
+        "faces": int(n),
+        "projected_mb": round(projected, 1),
+        "budget_mb": memory_budget_mb,
+        "strategy": "full",
+        "fit_faces": int(n),
+    }
+
+    if memory_budget_mb is None or projected <= memory_budget_mb:
+        if progress_callback and memory_budget_mb:
+            progress_callback.text(f"🧮 Лиц: {n}, прогноз памяти HDBSCAN: {projected:.0f} МБ (бюджет {memory_budget_mb} МБ)")
+        clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples, metric="euclidean", prediction_data=True)
+        labels = clusterer.fit_predict(X)
+        return labels, clusterer.probabilities_, info
+
+    # бюджет превышен: HDBSCAN на случайной выборке, остальные лица — approximate_predict кусками из memmap
+    fit_rows = rows_within_budget(memory_budget_mb, dim)
+    if fit_rows < 2 * min_cluster_size:
+        raise MemoryError(f"бюджет {memory_budget_mb} МБ слишком мал: в него помещается {fit_rows} лиц")
+    fraction = fit_rows / n
+    fit_min_cluster_size = max(2, int(round(min_cluster_size * fraction)))
+    info.update({"strategy": "approximate", "fit_faces": fit_rows, "fit_min_cluster_size": fit_min_cluster_size})
+    if progress_callback:
+        progress_callback.text(
+            f"🧮 Лиц: {n}, прогноз памяти HDBSCAN: {projected:.0f} МБ > бюджета {memory_budget_mb} МБ — "
+            f"приближённая кластеризация по выборке {fit_rows} лиц"
+        )
+
+    rng = np.random.default_rng(seed)
+    fit_idx = np.sort(rng.choice(n, fit_rows, replace=False))
+    clusterer = hdbscan.HDBSCAN(min_cluster_size=fit_min_cluster_size, min_samples=min_samples, metric="euclidean", prediction_data=True)
+    clusterer.fit(np.asarray(X[fit_idx], dtype=np.float64))
+
+    labels = np.empty(n, dtype=np.int64)
+    probabilities = np.empty(n, dtype=np.float64)
+    labels[fit_idx] = clusterer.labels_
+    probabilities[fit_idx] = clusterer.probabilities_
+
+    rest = np.ones(n, dtype=bool)
+    rest[fit_idx] = False
+    rest = np.flatnonzero(rest)
+    for start in range(0, len(rest), PREDICT_CHUNK):
+        idx = rest[start:start + PREDICT_CHUNK]
+        chunk_labels, strengths = hdbscan.approximate_predict(clusterer, np.asarray(X[idx], dtype=np.float64))
+        labels[idx] = chunk_labels
+        probabilities[idx] = strengths
+    return labels, probabilities, info
+
+def face_table(scan, face_clusters, probabilities):
+    # по строке на лицо, по столбцам: смотреть/обрезать/перекластеризовать без повторной детекции
+    return {
+        "path": [str(p) for p in scan["owners"]],
+        "bbox": np.round(scan["bboxes"], 1).tolist(),
+        "det_score": np.round(scan["det_scores"], 4).tolist(),
+        "cluster": [int(c) for c in face_clusters],
+        "prob": np.round(np.asarray(probabilities, dtype=np.float64), 4).tolist(),
+        "embedding_row": list(range(len(scan["owners"]))),
+    }
+
+def fit_dbscan(X, eps=DBSCAN_EPS, min_samples=2, progress_callback=None):
+    # без иерархии: один порог eps на всё множество; вероятность лица — 1 в кластере, 0 в шуме
+    if progress_callback:
+        progress_callback.text(f"🧮 DBSCAN по {len(X)} лицам (eps={eps})")
+    labels = DBSCAN(eps=eps, min_samples=min_samples, metric="cosine").fit_predict(np.asarray(X, dtype=np.float32))
+    info = {"strategy": "dbscan", "faces": int(len(X)), "eps": eps, "clusters": int(len(set(labels.tolist()) - {-1}))}
+    return labels, (labels != -1).astype(np.float64), info
+
+def fit_labels(X, method="hdbscan", min_cluster_size=3, min_samples=1, memory_budget_mb=None, progress_callback=None, micro_radius=MICRO_RADIUS, eps=DBSCAN_EPS):
+    if method == "two-stage":
+        return fit_two_stage(X, min_cluster_size, micro_radius, progress_callback)
+    if method == "dbscan":
+        return fit_dbscan(X, eps, min_samples, progress_callback)
+    if method != "hdbscan":
+        raise ValueError(f"неизвестный метод кластеризации {method!r}, допустимы: {', '.join(CLUSTER_METHODS)}")
+    return fit_hdbscan(X, min_cluster_size, min_samples, memory_budget_mb, progress_callback)
+
+def match_then_cluster(X, gallery, match_threshold=MATCH_THRESHOLD, **fit):
+    # сначала известные люди из галереи (метки 0..len(names)-1), кластеризуется только остаток
+    identity, score = match_faces(X, gallery, match_threshold)
+    count = len(gallery["names"])
+    labels = identity.copy()
+    probabilities = score.astype(np.float64)
+    rest = np.flatnonzero(identity == -1)
+    info = {}
+    if len(rest) >= fit["min_cluster_size"]:
+        if fit.get("progress_callback"):
+            fit["progress_callback"].text(f"📇 Узнано по галерее: {len(X) - len(rest)} лиц, кластеризуется остаток: {len(rest)}")
+        rest_labels, rest_probs, info = fit_labels(np.asarray(X[rest]), **fit)
+        labels[rest] = np.where(rest_labels == -1, -1, rest_labels + count)
+        probabilities[rest] = rest_probs
+    gallery_info = {"identities": count, "matched_faces": int(len(X) - len(rest)), "clustered_faces": int(len(rest))}
+    return labels, probabilities, info, gallery_info
+
+def cluster_scan(all_images, scan, min_cluster_size=3, min_samples=1, min_prob_threshold=0.85, memory_budget_mb=None, progress_callback=None, keep_faces=False, keep_embeddings=False, method="hdbscan", micro_radius=MICRO_RADIUS, gallery=None, match_threshold=MATCH_THRESHOLD, eps=DBSCAN_EPS):
+    X = scan["embeddings"]
+    owners = scan["owners"]
+    unreadable = scan["unreadable"]
+    no_faces = scan["no_faces"]
+
+    if not len(X):
+        result = {
+            "clusters": {},
+            "plan": [],
+            "unreadable": [str(p) for p in unreadable],
+            "no_faces": [str(p) for p in no_faces],
+        }
+        if scan.get("skipped_small"):
+            result["skipped_small"] = [str(p) for p in scan["skipped_small"]]
+        return result
+
+    fit = dict(method=method, min_cluster_size=min_cluster_size, min_samples=min_samples, memory_budget_mb=memory_budget_mb, progress_callback=progress_callback, micro_radius=micro_radius, eps=eps)
+    named = {}
+    if gallery is not None and gallery["names"]:
+        labels, probabilities, info, gallery_info = match_then_cluster(X, gallery, match_threshold, **fit)
+        named = dict(enumerate(gallery["names"]))
+    else:
+        labels, probabilities, info = fit_labels(X, **fit)
+
+    def accepted(lbl, prob):
+        # узнанные по галерее лица уже прошли порог сходства, порог вероятности HDBSCAN к ним не относится
+        return lbl != -1 and (lbl in named or prob >= min_prob_threshold)
+
+    cluster_map = {}
+    cluster_by_img = {}
+    for lbl, path, prob in zip(labels, owners, probabilities):
+        if not accepted(lbl, prob):
+            continue
+        cluster_map.setdefault(int(lbl), set()).add(path)
+        cluster_by_img.setdefault(path, set()).add(int(lbl))
+
+    # фильтрация: удаляем общие фото, если кластер меньше min_cluster_size (кроме известных людей — им хватает одного фото)
+    cluster_sizes = {k: len(v) if k not in named else min_cluster_size for k, v in cluster_map.items()}
+    plan = []
+    for path in all_images:
+        clusters = cluster_by_img.get(path, set())
+        valid_clusters = [cid for cid in clusters if cluster_sizes.get(cid, 0) >= min_cluster_size]
+        if valid_clusters:
+            plan.append({
+                "path": str(path),
+                "cluster": sorted(valid_clusters),
+            })
+
+    result = {
+        "clusters": {int(k): [str(p) for p in sorted(v, key=lambda x: str(x))] for k, v in cluster_map.items() if cluster_sizes[k] >= min_cluster_size},
+        "plan": plan,
+        "unreadable": [str(p) for p in unreadable],
+        "no_faces": [str(p) for p in no_faces],
+    }
+    if scan.get("skipped_small"):
+        result["skipped_small"] = [str(p) for p in scan["skipped_small"]]
+    if named:
+        result["names"] = {cid: name for cid, name in named.items() if cid in result["clusters"]}
+        result["gallery"] = gallery_info
+    if info and method != "hdbscan":
+        result["clustering"] = info
+    elif info and memory_budget_mb is not None:
+        result["memory"] = info
+    if keep_faces or keep_embeddings:
+        face_clusters = [
+            int(lbl) if accepted(lbl, prob) and cluster_sizes.get(int(lbl), 0) >= min_cluster_size else -1
+            for lbl, prob in zip(labels, probabilities)
+        ]
+        result["faces"] = face_table(scan, face_clusters, probabilities)
+    if keep_embeddings:
+        # строки совпадают с faces["embedding_row"]; сохраняются только в .npz-плане.
+        # Копия, а не вид: X может быть memmap файла подкачки, который удаляется сразу после кластеризации
+        result["embeddings"] = np.array(X, dtype=np.float16)
+    return result
+
+def open_spill(memory_budget_mb=None, spill_dir=None):
+    # при заданном бюджете эмбеддинги не копятся в списке, а уходят в float16-файл на диске
+    if memory_budget_mb is None:
+        return None
+    spill_dir = Path(spill_dir or tempfile.gettempdir())
+    return EmbeddingSpill(spill_dir / f"embeddings_{uuid.uuid4().hex}.f16", EMBEDDING_DIM)
+
+def build_plan_live(input_dir: Path, det_size=(1024, 1024), min_cluster_size=3, min_samples=1, min_prob_threshold=0.85, progress_callback=None, workers=1, batch_size=16, app=None, cancel_event=None, memory_budget_mb=None, spill_dir=None, model_options=None, min_side=0, max_side=None, keep_faces=False, keep_embeddings=False, method="hdbscan", micro_radius=MICRO_RADIUS, gallery=None, match_threshold=MATCH_THRESHOLD, eps=DBSCAN_EPS, largest_face=False, profiler=None, videos=False, video_stride=FRAME_STRIDE, bursts=False):
+    # profiler — facecluster.profiling.RunProfiler: таймеры стадий, сэмплы стеков, cProfile, профиль ONNX Runtime
+    # videos — ещё и ролики (выборочные кадры, лицо на человека); bursts — серии снимков с трекингом лиц
+    all_images = list_images(input_dir, videos)
+    app = app or load_model(det_size, **(model_options or {}))
+    timers = profiler.timers if profiler is not None else None
+    spill = open_spill(memory_budget_mb, spill_dir)
+    try:
+        with profiler.run(app) if profiler is not None else nullcontext():
+            with timed(timers, "scan"):
+                scan = scan_images(all_images, app, progress_callback, workers, batch_size, cancel_event, spill, min_side, max_side, largest_face, timers, bursts, video_stride)
+            if profiler is not None:
+                profiler.meta.update(images=len(all_images), faces=int(len(scan["embeddings"])), workers=workers, batch_size=batch_size, method=method)
+            with timed(timers, "cluster"):
+                plan = cluster_scan(all_images, scan, min_cluster_size, min_samples, min_prob_threshold, memory_budget_mb, progress_callback, keep_faces, keep_embeddings, method, micro_radius, gallery, match_threshold, eps)
+            if scan.get("media"):
+                plan["media"] = scan["media"]
+        del scan
+        return plan
+    finally:
+        if spill is not None:
+            spill.remove()
+
+build_plan = build_plan_live
+
+def renumber_clusters(plan, start=1):
+    # сквозная нумерация кластеров для очереди папок; возвращает число кластеров
+    old_to_new = {}
+    for i, cid in enumerate(sorted(plan.get("clusters", {}).keys(), key=int), start=start):
+        old_to_new[int(cid)] = i
+
+    plan["clusters"] = {
+        old_to_new[int(k)]: v for k, v in plan.get("clusters", {}).items() if int(k) in old_to_new
+    }
+
+    for entry in plan.get("plan", []):
+        entry["cluster"] = [old_to_new[cid] for cid in entry.get("cluster", []) if cid in old_to_new]
+
+    if "names" in plan:
+        plan["names"] = {old_to_new[int(k)]: v for k, v in plan["names"].items() if int(k) in old_to_new}
+
+    if "faces" in plan:
+        plan["faces"]["cluster"] = [old_to_new.get(cid, -1) for cid in plan["faces"]["cluster"]]
+
+    return len(old_to_new)
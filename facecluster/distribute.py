@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+JOURNAL_FORMAT = "face-distribute-journal"
+JOURNAL_VERSION = 1
+JOURNAL_DIR = ".distribute_journal"
+FLUSH_EVERY = 200
+UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+def _default_report(level, text):
+    print(f"[{level}] {text}")
+
+def default_journal_path(base_dir: Path):
+    now = time.time()
+    return Path(base_dir) / JOURNAL_DIR / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}.ndjson"
+
+def cluster_folder(cid, names=None):
+    # известные по галерее люди раскладываются в папки с их именами, остальные — в cluster_N
+    name = (names or {}).get(cid)
+    if name:
+        name = UNSAFE_CHARS.sub("_", name).strip().rstrip(".")
+    return name or f"cluster_{cid}"
+
+def unique_destination(dst: Path, taken):
+    # IMG_0001.jpg из разных папок попадает в один кластер: второй файл — «IMG_0001 (2).jpg».
+    # Регистр не различаем — на Windows и macOS это одно имя
+    candidate, n = dst, 1
+    while str(candidate).lower() in taken or candidate.exists():
+        n += 1
+        candidate = dst.with_name(f"{dst.stem} ({n}){dst.suffix}")
+    taken.add(str(candidate).lower())
+    return candidate
+
+def plan_operations(plan, base_dir: Path, keep_originals=False):
+    # общее фото копируется во все кластеры, кроме последнего, и перемещается в последний:
+    # результат тот же, что copy-во-все + unlink, но на одну копию меньше и операции обратимы.
+    # keep_originals — только копии, исходная папка не меняется
+    base_dir = Path(base_dir)
+    names = plan.get("names")
+    ops = []
+    taken = set()
+    for item in plan.get("plan", []):
+        clusters = item["cluster"]
+        if not clusters:
+            continue
+        src = Path(item["path"])
+        targets = [unique_destination(base_dir / cluster_folder(cid, names) / src.name, taken) for cid in clusters]
+        if keep_originals:
+            ops.extend({"op": "copy", "src": str(src), "dst": str(dst)} for dst in targets)
+            continue
+        for dst in targets[:-1]:
+            ops.append({"op": "copy", "src": str(src), "dst": str(dst)})
+        ops.append({"op": "move", "src": str(src), "dst": str(targets[-1]), "shared": len(targets) > 1})
+    return ops
+
+def counted_as(op):
+    # общее фото считается копией в каждый свой кластер, в том числе в тот, куда оно перемещается
+    return "copy" if op["op"] == "copy" or op.get("shared") else "move"
+
+def _volume(path: Path):
+    # ближайший существующий предок: целевой cluster_N ещё может не существовать
+    for p in [path, *path.parents]:
+        try:
+            return os.stat(p).st_dev, p.anchor or str(p)
+        except OSError:
+            continue
+    return None, path.anchor
+
+def dry_run(plan, base_dir: Path, keep_originals=False):
+    # только stat, без чтения файлов: сколько байт переедет/скопируется на каждый целевой том
+    volumes = {}
+    missing = 0
+    dev_cache = {}
+    for op in plan_operations(plan, base_dir, keep_originals):
+        src, dst = Path(op["src"]), Path(op["dst"])
+        try:
+            st = os.stat(src)
+        except OSError:
+            if op["op"] == "move":
+                missing += 1
+            continue
+        parent = dst.parent
+        if parent not in dev_cache:
+            dev_cache[parent] = _volume(parent)
+        dev, label = dev_cache[parent]
+        stats = volumes.setdefault(label, {"moves": 0, "move_bytes": 0, "copies": 0, "copy_bytes": 0, "cross_device_moves": 0, "cross_device_bytes": 0})
+        if counted_as(op) == "copy":
+            stats["copies"] += 1
+            stats["copy_bytes"] += st.st_size
+        else:
+            stats["moves"] += 1
+            stats["move_bytes"] += st.st_size
+        if op["op"] == "move" and dev is not None and st.st_dev != dev:
+            # перемещение между томами — это копирование с удалением, а не переименование
+            stats["cross_device_moves"] += 1
+            stats["cross_device_bytes"] += st.st_size
+    moved = sum(s["moves"] for s in volumes.values())
+    copied = sum(s["copies"] for s in volumes.values())
+    # moved/copied — те же числа, что вернёт apply_journal
+    return {"operations": moved + copied, "moved": moved, "copied": copied, "missing": missing, "volumes": volumes}
+
+class Journal:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+        self._pending = 0
+
+    def create(self, base_dir, ops):
+        # журнал пишется целиком до первой операции с файлами
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            header = {"format": JOURNAL_FORMAT, "version": JOURNAL_VERSION, "base_dir": str(base_dir), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "ops": len(ops)}
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for i, op in enumerate(ops):
+                f.write(json.dumps({"i": i, **op}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, entry):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+def read_journal(path: Path):
+    header, ops, status, flags = None, [], {}, set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # недописанная последняя строка после аварийного завершения
+            if header is None:
+                if entry.get("format") != JOURNAL_FORMAT:
+                    raise ValueError(f"{path}: не журнал распределения")
+                header = entry
+            elif "op" in entry:
+                ops.append(entry)
+            elif "flag" in entry:
+                flags.add(entry["flag"])
+            else:
+                for state in ("done", "failed", "skipped", "undone"):
+                    if state in entry:
+                        status[entry[state]] = state
+    if header is None:
+        raise ValueError(f"{path}: пустой журнал")
+    return {"header": header, "ops": ops, "status": status, "flags": flags}
+
+def _looks_done(op):
+    # статус мог не попасть в журнал при аварии: восстанавливаем по файловой системе
+    src, dst = Path(op["src"]), Path(op["dst"])
+    if op["op"] == "move":
+        return dst.exists() and not src.exists()
+    return dst.exists() and src.exists() and dst.stat().st_size == src.stat().st_size
+
+def apply_journal(path: Path, report=None):
+    report = report or _default_report
+    state = read_journal(path)
+    journal = Journal(path)
+    moved, copied = 0, 0
+    failed_src = set()
+    touched_dirs = set()
+
+    try:
+        for d in {str(Path(op["dst"]).parent) for op in state["ops"]}:
+            Path(d).mkdir(parents=True, exist_ok=True)
+
+        for op in state["ops"]:
+            i = op["i"]
+            src, dst = Path(op["src"]), Path(op["dst"])
+            # при повторном запуске (после сбоя) выполненные операции пропускаются, неудачные повторяются
+            done = state["status"].get(i) == "done" or (i not in state["status"] and _looks_done(op))
+            if not done:
+                if not src.exists() or op["src"] in failed_src:
+                    journal.record({"skipped": i})
+                    continue
+                try:
+                    if dst.exists():
+                        # имена уникальны на момент планирования; файл, появившийся позже, не затираем
+                        raise FileExistsError(f"файл уже существует: {dst}")
+                    if op["op"] == "copy":
+                        shutil.copy2(str(src), str(dst))
+                    else:
+                        shutil.move(str(src), str(dst))
+                except Exception as e:
+                    failed_src.add(op["src"])
+                    journal.record({"failed": i, "error": str(e)})
+                    if op["op"] == "copy":
+                        report("error", f"❌ Ошибка копирования {src} → {dst}: {e}")
+                    else:
+                        report("error", f"❌ Ошибка перемещения {src} → {dst}: {e}")
+                    continue
+                journal.record({"done": i})
+            if counted_as(op) == "copy":
+                copied += 1
+            else:
+                moved += 1
+            if op["op"] == "move":
+                touched_dirs.add(src.parent)
+
+        for p in sorted(touched_dirs, key=lambda x: len(str(x)), reverse=True):
+            try:
+                if p.exists() and not any(p.iterdir()):
+                    p.rmdir()
+                    journal.record({"rmdir": str(p)})
+            except Exception:
+                pass
+        journal.record({"flag": "complete"})
+    finally:
+        journal.close()
+    return moved, copied
+
+def undo_journal(path: Path, report=None):
+    # обратный проход по журналу: перемещения возвращаются, копии удаляются
+    report = report or _default_report
+    state = read_journal(path)
+    if "undone" in state["flags"]:
+        return 0, 0
+    journal = Journal(path)
+    restored, removed = 0, 0
+    created_dirs = set()
+
+    try:
+        for op in reversed(state["ops"]):
+            i = op["i"]
+            st = state["status"].get(i)
+            if st == "undone" or st in ("failed", "skipped"):
+                continue
+            if st != "done" and not _looks_done(op):
+                continue
+            src, dst = Path(op["src"]), Path(op["dst"])
+            created_dirs.add(dst.parent)
+            entry = {"undone": i}
+            try:
+                if op["op"] == "move":
+                    src.parent.mkdir(parents=True, exist_ok=True)
+                    target = src
+                    if src.exists() and dst.exists():
+                        # на место оригинала уже положили новый файл с тем же именем — его не затираем
+                        target = unique_destination(src, set())
+                        entry["restored_to"] = str(target)
+                        report("warning", f"⚠️ {src} уже существует, файл возвращён как {target.name}")
+                    shutil.move(str(dst), str(target))
+                    restored += 1
+                else:
+                    dst.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                report("error", f"❌ Не удалось откатить {dst}: {e}")
+                continue
+            journal.record(entry)
+
+        for p in sorted(created_dirs, key=lambda x: len(str(x)), reverse=True):
+            try:
+                if p.exists() and not any(p.iterdir()):
+                    p.rmdir()
+            except Exception:
+                pass
+        journal.record({"flag": "undone"})
+    finally:
+        journal.close()
+    return restored, removed
+
+def distribute_to_folders(plan, base_dir: Path, report=None, journal_path=None, keep_originals=False):
+    # report(level, text): level — "error" / "warning", чтобы UI и CLI выводили ошибки по-своему
+    base_dir = Path(base_dir)
+    journal_path = Path(journal_path or default_journal_path(base_dir))
+    Journal(journal_path).create(base_dir, plan_operations(plan, base_dir, keep_originals))
+    return apply_journal(journal_path, report)
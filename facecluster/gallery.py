@@ -0,0 +1,198 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from facecluster.memory import PREDICT_CHUNK
+
+GALLERY_FORMAT = "face-gallery"
+GALLERY_VERSION = 1
+MAX_FACES = 500  # лиц на человека в галерее: больше не нужно для среднего и образцов
+MAX_EXEMPLARS = 5  # образцов на человека (ракурсы, возраст, очки) в дополнение к среднему
+MATCH_THRESHOLD = 0.5  # косинус к лучшему образцу, ниже — лицо уходит в обычную кластеризацию
+MATCH_MARGIN = 0.05  # если второй по сходству человек ближе этого — лицо неоднозначно
+
+def _normalize(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.maximum(np.linalg.norm(v, axis=-1, keepdims=True), 1e-12)
+
+def empty_gallery(dim=512):
+    return {
+        "names": [],
+        "faces": np.zeros((0, dim), dtype=np.float16),
+        "owner": np.zeros(0, dtype=np.int32),
+        "means": np.zeros((0, dim), dtype=np.float32),
+        "exemplars": np.zeros((0, dim), dtype=np.float32),
+        "exemplar_owner": np.zeros(0, dtype=np.int32),
+        "meta": {},
+    }
+
+def _summarize(faces, seed=0):
+    # среднее + центры k-means как образцы: центр устойчивее к случайному чужому лицу, чем само лицо
+    faces = _normalize(faces)
+    mean = _normalize(faces.mean(axis=0))
+    if len(faces) <= MAX_EXEMPLARS:
+        return mean, faces
+    centers = KMeans(MAX_EXEMPLARS, n_init=3, random_state=seed).fit(faces).cluster_centers_
+    return mean, _normalize(centers)
+
+def _rebuild(names, per_name, meta):
+    gallery = empty_gallery(next(iter(per_name.values())).shape[1]) if per_name else empty_gallery()
+    gallery["meta"] = meta
+    if not names:
+        return gallery
+    faces, owner, means, exemplars, exemplar_owner = [], [], [], [], []
+    for i, name in enumerate(names):
+        f = per_name[name]
+        mean, ex = _summarize(f)
+        faces.append(np.asarray(f, dtype=np.float16))
+        owner.append(np.full(len(f), i, dtype=np.int32))
+        means.append(mean)
+        exemplars.append(ex)
+        exemplar_owner.append(np.full(len(ex), i, dtype=np.int32))
+    gallery.update(
+        names=list(names),
+        faces=np.vstack(faces),
+        owner=np.concatenate(owner),
+        means=np.vstack(means),
+        exemplars=np.vstack(exemplars),
+        exemplar_owner=np.concatenate(exemplar_owner),
+    )
+    return gallery
+
+def identity_faces(gallery):
+    return {name: gallery["faces"][gallery["owner"] == i] for i, name in enumerate(gallery["names"])}
+
+def _subsample(embeddings, seed=0):
+    if len(embeddings) <= MAX_FACES:
+        return embeddings
+    rng = np.random.default_rng(seed)
+    return embeddings[np.sort(rng.choice(len(embeddings), MAX_FACES, replace=False))]
+
+def build_gallery(per_name, meta=None, seed=0):
+    # сразу много людей: среднее и образцы считаются один раз на человека, а не при каждом add_identity
+    per_name = {str(name): _subsample(_normalize(faces), seed) for name, faces in per_name.items() if len(faces)}
+    return _rebuild(list(per_name), per_name, dict(meta or {}))
+
+def add_identity(gallery, name, embeddings, seed=0):
+    # новые лица добавляются к уже известным под тем же именем; среднее и образцы пересчитываются
+    name = str(name).strip()
+    if not name:
+        raise ValueError("пустое имя")
+    embeddings = _normalize(embeddings).reshape(len(embeddings), -1)
+    if not len(embeddings):
+        raise ValueError(f"{name}: нет лиц для добавления")
+    per_name = identity_faces(gallery)
+    names = list(gallery["names"])
+    if name in per_name:
+        embeddings = np.vstack([per_name[name].astype(np.float32), embeddings])
+    else:
+        names.append(name)
+    per_name[name] = _subsample(embeddings, seed)
+    return _rebuild(names, per_name, gallery["meta"])
+
+def remove_identity(gallery, name):
+    if name not in gallery["names"]:
+        raise KeyError(name)
+    per_name = identity_faces(gallery)
+    del per_name[name]
+    return _rebuild([n for n in gallery["names"] if n != name], per_name, gallery["meta"])
+
+def gallery_summary(gallery):
+    faces = np.bincount(gallery["owner"], minlength=len(gallery["names"]))
+    exemplars = np.bincount(gallery["exemplar_owner"], minlength=len(gallery["names"]))
+    return [{"name": name, "faces": int(faces[i]), "exemplars": int(exemplars[i])} for i, name in enumerate(gallery["names"])]
+
+def save_gallery(gallery, path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    meta = {
+        **gallery.get("meta", {}),
+        "format": GALLERY_FORMAT,
+        "version": GALLERY_VERSION,
+        "names": gallery["names"],
+        "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            faces=gallery["faces"],
+            owner=gallery["owner"],
+            means=gallery["means"],
+            exemplars=gallery["exemplars"],
+            exemplar_owner=gallery["exemplar_owner"],
+        )
+    return path
+
+def load_gallery(path: Path):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format") != GALLERY_FORMAT:
+            raise ValueError(f"{path}: не файл галереи")
+        if meta.get("version", 0) > GALLERY_VERSION:
+            raise ValueError(f"{path}: версия галереи {meta['version']} новее поддерживаемой {GALLERY_VERSION}")
+        names = meta.pop("names")
+        for key in ("format", "version", "updated"):
+            meta.pop(key, None)
+        return {
+            "names": names,
+            "faces": data["faces"],
+            "owner": data["owner"],
+            "means": data["means"],
+            "exemplars": data["exemplars"],
+            "exemplar_owner": data["exemplar_owner"],
+            "meta": meta,
+        }
+
+def match_faces(X, gallery, threshold=MATCH_THRESHOLD, margin=MATCH_MARGIN, chunk=PREDICT_CHUNK):
+    # сходство с человеком — максимум косинуса по его среднему и образцам; одно умножение матриц
+    # на блок лиц вместо кластеризации. Возвращает (индекс имени или -1, лучший косинус)
+    n = len(X)
+    identity = np.full(n, -1, dtype=np.int64)
+    score = np.zeros(n, dtype=np.float32)
+    count = len(gallery["names"])
+    if not n or not count:
+        return identity, score
+
+    vectors = np.vstack([gallery["means"], gallery["exemplars"]]).astype(np.float32)
+    owner = np.concatenate([np.arange(count), gallery["exemplar_owner"]])
+    order = np.argsort(owner, kind="stable")
+    vectors, owner = vectors[order], owner[order]
+    starts = np.searchsorted(owner, np.arange(count))
+
+    for start in range(0, n, chunk):
+        sim = _normalize(X[start:start + chunk]) @ vectors.T
+        per_person = np.maximum.reduceat(sim, starts, axis=1)
+        best = per_person.argmax(axis=1)
+        top = per_person[np.arange(len(best)), best]
+        if count > 1:
+            second = np.partition(per_person, count - 2, axis=1)[:, count - 2]
+        else:
+            second = np.full(len(best), -1.0, dtype=np.float32)
+        ok = (top >= threshold) & (top - second >= margin)
+        identity[start:start + chunk] = np.where(ok, best, -1)
+        score[start:start + chunk] = top
+    return identity, score
+
+def largest_faces(scan):
+    # эмбеддинг самого крупного лица на каждом фото: в папке с фото человека рядом бывают и чужие лица
+    best = {}
+    area = (scan["bboxes"][:, 2] - scan["bboxes"][:, 0]) * (scan["bboxes"][:, 3] - scan["bboxes"][:, 1])
+    for row, owner in enumerate(scan["owners"]):
+        if owner not in best or area[row] > area[best[owner]]:
+            best[owner] = row
+    rows = sorted(best.values())
+    return np.asarray(scan["embeddings"][rows], dtype=np.float32)
+
+def cluster_embeddings(plan, embeddings, cluster):
+    # лица кластера из плана, сохранённого с --keep-embeddings
+    faces = plan.get("faces")
+    if faces is None or embeddings is None:
+        raise ValueError("в плане нет эмбеддингов лиц: постройте его с --keep-embeddings")
+    rows = [row for row, cid in zip(faces["embedding_row"], faces["cluster"]) if cid == cluster]
+    if not rows:
+        raise ValueError(f"в плане нет лиц кластера {cluster}")
+    return np.asarray(embeddings[rows], dtype=np.float32)
@@ -0,0 +1,66 @@
+import cv2
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow заголовки не читаются, изображения декодируются как раньше
+    Image = None
+
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_MAKE = 0x010F
+EXIF_MODEL = 0x0110
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def read_header(path):
+    # Image.open читает только заголовок и EXIF, пиксели не декодируются
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+            exif = im.getexif()
+            taken = None
+            try:
+                taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL)
+            except Exception:
+                pass
+            camera = " ".join(str(exif[k]).strip() for k in (EXIF_MAKE, EXIF_MODEL) if exif.get(k)) or None
+            return {
+                "width": width,
+                "height": height,
+                "orientation": int(exif.get(EXIF_ORIENTATION, 1) or 1),
+                "taken": taken or exif.get(EXIF_DATETIME),
+                "camera": camera,
+            }
+    except Exception:
+        return None
+
+def apply_orientation(img, orientation):
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(img), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+def reduce_factor(header, max_side):
+    # во сколько раз уменьшать при декодировании (JPEG масштабируется прямо в DCT, это дешевле полного декода)
+    if not header or not max_side:
+        return 1
+    factor = 1
+    longest = max(header["width"], header["height"])
+    while factor < 8 and longest // (factor * 2) >= max_side:
+        factor *= 2
+    return factor
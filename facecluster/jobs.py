@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+from facecluster.cluster import JobCancelled, build_plan_live, load_model, renumber_clusters
+from facecluster.gallery import load_gallery
+from facecluster.progress import ProgressChannel, format_event
+from facecluster.planio import plan_file_name, save_plan
+from facecluster.distribute import default_journal_path, distribute_to_folders, undo_journal
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {DONE, FAILED, CANCELLED}
+
+PLAN = "plan"
+UNDO = "undo"
+
+class Job:
+    def __init__(self, folder, batch, options, kind=PLAN):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.folder = str(folder)
+        self.batch = batch
+        self.options = options
+        self.status = QUEUED
+        # сканирование пишет событие на каждое фото, UI забирает последнее при перерисовке
+        self.progress = ProgressChannel()
+        self.result = None
+        self.error = None
+        self.messages = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    def text(self, message):
+        self.progress.text(message)
+
+    @property
+    def message(self):
+        event = self.progress.latest()
+        return format_event(event) if event else ""
+
+    def report(self, level, text):
+        self.messages.append((level, text))
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class JobManager:
+    # одна фоновая очередь на процесс: задачи живут дольше сессии браузера и перезапусков скрипта
+    def __init__(self, plan_dir=".", workers=1, batch_size=16, plan_format="npz"):
+        self.plan_dir = Path(plan_dir)
+        self.plan_format = plan_format
+        self.workers = workers
+        self.batch_size = batch_size
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._models = {}
+
+    def submit(self, folders, **options):
+        batch = {"cluster_offset": 1}  # сквозная нумерация кластеров внутри одной отправленной очереди
+        return self._enqueue([Job(folder, batch, options) for folder in folders])
+
+    def _enqueue(self, jobs):
+        with self._lock:
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._queue.put(job.id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="face-cluster-jobs", daemon=True)
+                self._thread.start()
+        return jobs
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_event.set()
+        if job.status == QUEUED:
+            job.status = CANCELLED
+            job.finished = time.time()
+        return True
+
+    def undo(self, job_id):
+        # откат распределения завершённой задачи по её журналу — отдельной задачей в той же очереди,
+        # чтобы не блокировать UI на тысячах файлов
+        job = self._jobs.get(job_id)
+        if job is None or job.kind != PLAN or job.status != DONE or not job.result or job.result.get("undo_job"):
+            return None
+        undo_job = self._enqueue([Job(job.folder, None, {"journal": job.result["journal"], "source": job.id}, kind=UNDO)])[0]
+        job.result["undo_job"] = undo_job.id
+        return undo_job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def active(self):
+        return any(job.status in (QUEUED, RUNNING) for job in self.jobs())
+
+    def clear_finished(self):
+        with self._lock:
+            for job_id in [k for k, job in self._jobs.items() if job.status in FINISHED]:
+                del self._jobs[job_id]
+
+    def _model(self, det_size, model_options):
+        # модель грузится один раз на набор параметров и переиспользуется между задачами
+        key = (tuple(det_size), tuple(sorted(model_options.items())))
+        if key not in self._models:
+            self._models[key] = load_model(tuple(det_size), **model_options)
+        return self._models[key]
+
+    def _worker(self):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            self._run(job)
+
+    def _run_undo(self, job):
+        job.text("↩️ Откат распределения...")
+        restored, removed = undo_journal(Path(job.options["journal"]), report=job.report)
+        job.result = {"restored": restored, "removed": removed}
+        source = self._jobs.get(job.options["source"])
+        if source is not None and source.result:
+            source.result["undone"] = True
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            if job.kind == UNDO:
+                self._run_undo(job)
+                job.status = DONE
+                return
+            path = Path(job.folder)
+            if not path.exists():
+                raise FileNotFoundError(f"Путь не существует: {path}")
+            options = dict(job.options)
+            det_size = options.get("det_size", (1024, 1024))
+            model_options = options.pop("model_options", None) or {}
+            if options.get("gallery"):
+                options["gallery"] = load_gallery(Path(options["gallery"]))
+            plan = build_plan_live(
+                path,
+                progress_callback=job.progress,
+                workers=self.workers,
+                batch_size=self.batch_size,
+                app=self._model(det_size, model_options),
+                cancel_event=job.cancel_event,
+                **options,
+            )
+            if job.cancel_event.is_set():
+                raise JobCancelled("остановлено перед распределением")
+
+            job.batch["cluster_offset"] += renumber_clusters(plan, start=job.batch["cluster_offset"])
+            plan_file = save_plan(plan, self.plan_dir / plan_file_name(path.name, self.plan_format))
+
+            job.text("📦 Распределение по папкам...")
+            journal_path = default_journal_path(path)
+            moved, copied = distribute_to_folders(plan, path, report=job.report, journal_path=journal_path)
+            job.result = {
+                "moved": moved,
+                "copied": copied,
+                "clusters": len(plan.get("clusters", {})),
+                "names": len(plan.get("names", {})),
+                "plan_file": str(plan_file),
+                "journal": str(journal_path),
+                "unreadable": plan.get("unreadable", []),
+                "no_faces": plan.get("no_faces", []),
+                "skipped_small": plan.get("skipped_small", []),
+            }
+            job.status = DONE
+        except JobCancelled as e:
+            job.error = str(e)
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.messages.append(("error", traceback.format_exc()))
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
@@ -0,0 +1,214 @@
+import math
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+try:
+    from insightface.app.common import Face
+except ImportError:  # без insightface отдельного детектора нет: лица приходят готовыми из app.get
+    Face = None
+
+VIDEO_EXTS = {'.mp4', '.mov', '.m4v', '.avi', '.mkv', '.webm', '.3gp', '.mts'}
+FRAME_STRIDE = 1.0  # секунд между выборочными кадрами ролика
+MAX_FRAMES = 300  # кадров с одного ролика: у длинных шаг растёт, чтобы покрыть весь ролик
+TRACK_IOU = 0.3  # лицо, перекрывающее лицо предыдущего кадра хотя бы на столько, продолжает его трек
+TRACK_GAP = 2  # выборочных кадров без совпадения, после которых трек закрывается
+TRACK_SIMILARITY = 0.6  # косинус, при котором обрывки треков одного ролика считаются одним человеком
+BURST_GAP = 2  # секунд между соседними снимками серии (EXIF, точность — секунда)
+
+def is_video(p: Path) -> bool:
+    return p.suffix.lower() in VIDEO_EXTS
+
+def iou(box, boxes):
+    # box (4,) против boxes (n, 4)
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+def detect_faces(app, img):
+    # только детектор: рамки и ключевые точки без распознавания. Модель без отдельного детектора — обычный app.get
+    det_model = getattr(app, "det_model", None)
+    if det_model is None or Face is None:
+        return app.get(img)
+    bboxes, kpss = det_model.detect(img, max_num=0, metric="default")
+    return [
+        Face(bbox=bboxes[i, :4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for i in range(len(bboxes))
+    ]
+
+def embed_face(app, img, face):
+    # остальные модели FaceAnalysis (распознавание и т. п.) — для одного лица, как делает app.get
+    if getattr(face, "embedding", None) is not None:
+        return face
+    for task, model in app.models.items():
+        if task != "detection":
+            model.get(img, face)
+    return face
+
+class Track:
+    def __init__(self, frame):
+        self.first = frame
+        self.last = frame
+        self.frames = 0
+        self.box = None
+        self.quality = -1.0
+        self.best = None  # (кадр, лицо) с наибольшими уверенностью × площадью
+        self.embedding = None
+
+    def add(self, frame, face, img):
+        self.last = frame
+        self.frames += 1
+        self.box = np.asarray(face.bbox, dtype=np.float32)
+        quality = float(face.det_score) * float((self.box[2] - self.box[0]) * (self.box[3] - self.box[1]))
+        if quality > self.quality:
+            self.quality = quality
+            self.best = (img, face)
+
+class FaceTracker:
+    # треки лиц по соседним кадрам: детектор — на каждом кадре, распознавание — один раз на трек.
+    # eager=True (серии снимков): лицо распознаётся при появлении, продолжения трека получают тот же эмбеддинг.
+    # eager=False (ролики): распознаётся лучшее лицо трека, когда трек закрыт
+    def __init__(self, app, eager=True, iou_threshold=TRACK_IOU, gap=TRACK_GAP):
+        self.app = app
+        self.eager = eager
+        self.iou_threshold = iou_threshold
+        self.gap = gap
+        self.frame = 0
+        self.active = []
+        self.finished = []
+        self.faces = 0
+        self.embedded = 0
+
+    def _embed(self, track, img, face):
+        embed_face(self.app, img, face)
+        track.embedding = getattr(face, "embedding", None)
+        self.embedded += 1
+
+    def step(self, img):
+        faces = detect_faces(self.app, img)
+        self.faces += len(faces)
+        boxes = np.array([f.bbox for f in faces], dtype=np.float32).reshape(-1, 4)
+        # жадно, по убыванию перекрытия: каждому треку — не больше одного лица
+        pairs = []
+        for ti, track in enumerate(self.active):
+            if len(boxes):
+                overlaps = iou(track.box, boxes)
+                pairs.extend((overlaps[fi], ti, fi) for fi in np.flatnonzero(overlaps >= self.iou_threshold))
+        assigned, taken = {}, set()
+        for _, ti, fi in sorted(pairs, reverse=True):
+            if ti not in taken and fi not in assigned:
+                assigned[fi] = ti
+                taken.add(ti)
+        tracks = list(self.active)
+        for fi, face in enumerate(faces):
+            if fi in assigned:
+                track = tracks[assigned[fi]]
+            else:
+                track = Track(self.frame)
+                self.active.append(track)
+            track.add(self.frame, face, None if self.eager else img)
+            if self.eager:
+                if track.embedding is None:
+                    self._embed(track, img, face)
+                else:
+                    face.embedding = track.embedding
+        self._close([t for t in self.active if self.frame - t.last >= self.gap])
+        self.active = [t for t in self.active if self.frame - t.last < self.gap]
+        self.frame += 1
+        return faces
+
+    def _close(self, tracks):
+        # у серий эмбеддинг уже роздан лицам, закрытые треки не нужны
+        if not self.eager:
+            self.finished.extend(tracks)
+
+    def reset(self):
+        self._close(self.active)
+        self.active = []
+
+    def finish(self):
+        self.reset()
+        tracks, self.finished = self.finished, []
+        for track in tracks:
+            if track.embedding is None:
+                img, face = track.best
+                self._embed(track, img, face)
+        return [t for t in tracks if t.embedding is not None]
+
+def join_tracks(tracks, similarity=TRACK_SIMILARITY):
+    # обрывки одного человека (отвернулся, вышел из кадра) — по сходству эмбеддингов; от группы — лучший трек
+    if not tracks:
+        return []
+    E = np.array([t.embedding for t in tracks], dtype=np.float32)
+    E /= np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-12)
+    parent = list(range(len(tracks)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(E @ E.T >= similarity, 1))):
+        parent[root(i)] = root(j)
+    groups = {}
+    for i, track in enumerate(tracks):
+        groups.setdefault(root(i), []).append(track)
+    return [max(group, key=lambda t: t.quality) for group in groups.values()]
+
+def iter_video_frames(path: Path, stride=FRAME_STRIDE, max_frames=MAX_FRAMES, max_side=None):
+    # grab() только продвигает поток, кадр переводится в BGR лишь для выбранных retrieve()
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        return
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        step = max(1, round(fps * stride), math.ceil(count / max_frames) if count > 0 else 1)
+        index = taken = 0
+        while taken < max_frames and cap.grab():
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if ok and frame is not None:
+                    if max_side and max(frame.shape[:2]) > max_side:
+                        scale = max_side / max(frame.shape[:2])
+                        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    yield index, frame
+                    taken += 1
+            index += 1
+    finally:
+        cap.release()
+
+def scan_video(path: Path, app, stride=FRAME_STRIDE, max_frames=MAX_FRAMES, max_side=None, similarity=TRACK_SIMILARITY):
+    # лица ролика: по одному на человека (лучший кадр его треков); None — ролик не открылся
+    tracker = FaceTracker(app, eager=False)
+    frames = 0
+    for _, frame in iter_video_frames(path, stride, max_frames, max_side):
+        tracker.step(frame)
+        frames += 1
+    if not frames:
+        return None
+    tracks = tracker.finish()
+    people = join_tracks(tracks, similarity)
+    return {"faces": [t.best[1] for t in people], "frames": frames, "tracks": len(tracks), "embedded": tracker.embedded}
+
+def _taken(header):
+    try:
+        return datetime.strptime(str(header["taken"]).strip("\0 "), "%Y:%m:%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def same_burst(prev_path, prev_header, path, header, gap=BURST_GAP):
+    # соседние снимки одной серии: та же папка, камера и размер, время съёмки по EXIF не дальше gap секунд
+    if prev_header is None or header is None or Path(prev_path).parent != Path(path).parent:
+        return False
+    if (prev_header["width"], prev_header["height"], prev_header.get("camera")) != (header["width"], header["height"], header.get("camera")):
+        return False
+    a, b = _taken(prev_header), _taken(header)
+    return a is not None and b is not None and abs((b - a).total_seconds()) <= gap
@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+# HDBSCAN приводит данные к float64 и строит KD-дерево со своей копией точек,
+# плюс core distances, MST и сжатое дерево — порядка сотни байт на точку
+HDBSCAN_COPIES = 2
+HDBSCAN_PER_POINT_BYTES = 256
+PREDICT_CHUNK = 10000
+
+class EmbeddingSpill:
+    # эмбеддинги пишутся построчно в float16-файл и читаются обратно через np.memmap
+    def __init__(self, path: Path, dim=512, dtype=np.float16):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(self.path, "wb")
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.dim)
+        self._file.write(rows.tobytes())
+        self.count += len(rows)
+
+    def finish(self):
+        self._file.close()
+        if not self.count:
+            return np.zeros((0, self.dim), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+
+    def remove(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def estimate_hdbscan_mb(n, dim):
+    return (n * dim * 8 * HDBSCAN_COPIES + n * HDBSCAN_PER_POINT_BYTES) / 2**20
+
+def rows_within_budget(budget_mb, dim):
+    return int(budget_mb * 2**20 // (dim * 8 * HDBSCAN_COPIES + HDBSCAN_PER_POINT_BYTES))
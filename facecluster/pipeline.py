@@ -0,0 +1,90 @@
+from pathlib import Path
+
+from facecluster.cluster import DBSCAN_EPS, MICRO_RADIUS, build_plan_live, load_model, renumber_clusters
+from facecluster.distribute import default_journal_path, distribute_to_folders, dry_run
+from facecluster.gallery import MATCH_THRESHOLD, load_gallery
+from facecluster.media import FRAME_STRIDE
+from facecluster.runtime import DEFAULT_MODULES
+
+# стадии конвейера и их опции по умолчанию: каждая оптимизация — опция своей стадии,
+# поэтому попадает во все приложения сразу
+STAGES = {
+    # декодирование: потоки, отсев маленьких по заголовку, уменьшение JPEG при декодировании, memmap для эмбеддингов,
+    # выборочные кадры роликов и трекинг лиц в сериях снимков
+    "reader": {"workers": 1, "batch_size": 16, "min_side": 0, "max_side": None, "spill_dir": None, "videos": False, "video_stride": FRAME_STRIDE, "bursts": False},
+    # детектор и эмбеддер — одна FaceAnalysis; session — опции ONNX Runtime (см. runtime.session_options)
+    "detector": {"det_size": (1024, 1024), "model_pack": "buffalo_l", "providers": None, "modules": DEFAULT_MODULES, "session": None},
+    "embedder": {"rec_model": None, "largest_face": False},
+    "clusterer": {"method": "hdbscan", "min_cluster_size": 3, "min_samples": 1, "memory_budget_mb": None, "micro_radius": MICRO_RADIUS, "eps": DBSCAN_EPS},
+    "planner": {"min_prob_threshold": 0.85, "keep_faces": False, "keep_embeddings": False, "gallery": None, "match_threshold": MATCH_THRESHOLD},
+    "distributor": {"keep_originals": False},
+}
+
+class Pipeline:
+    # чтение → детектор → эмбеддер → кластеризация → план → распределение.
+    # Pipeline(clusterer={"method": "two-stage"}, reader={"workers": 4}).run("D:/фото")
+    def __init__(self, **stages):
+        unknown = sorted(set(stages) - set(STAGES))
+        if unknown:
+            raise ValueError(f"неизвестные стадии: {', '.join(unknown)}; допустимы: {', '.join(STAGES)}")
+        self.options = {}
+        for stage, defaults in STAGES.items():
+            options = dict(stages.get(stage) or {})
+            bad = sorted(set(options) - set(defaults))
+            if bad:
+                raise ValueError(f"{stage}: неизвестные опции {', '.join(bad)}; допустимы: {', '.join(defaults)}")
+            self.options[stage] = {**defaults, **options}
+        gallery = self.options["planner"]["gallery"]
+        if isinstance(gallery, (str, Path)):
+            self.options["planner"]["gallery"] = load_gallery(Path(gallery))
+        self._app = None
+
+    def model(self):
+        # модель загружается один раз на конвейер и переиспользуется для всех папок
+        if self._app is None:
+            detector, embedder = self.options["detector"], self.options["embedder"]
+            self._app = load_model(
+                detector["det_size"], detector["model_pack"], embedder["rec_model"],
+                detector["modules"], detector["providers"], **(detector["session"] or {}),
+            )
+        return self._app
+
+    def plan(self, input_dir, progress_callback=None, cancel_event=None, profiler=None):
+        o = self.options
+        return build_plan_live(
+            Path(input_dir),
+            det_size=o["detector"]["det_size"],
+            progress_callback=progress_callback,
+            app=self.model(),
+            cancel_event=cancel_event,
+            largest_face=o["embedder"]["largest_face"],
+            profiler=profiler,
+            **o["reader"],
+            **o["clusterer"],
+            **o["planner"],
+        )
+
+    def distribute(self, plan, base_dir, report=None, journal_path=None):
+        base_dir = Path(base_dir)
+        return distribute_to_folders(
+            plan, base_dir, report=report, journal_path=journal_path or default_journal_path(base_dir),
+            keep_originals=self.options["distributor"]["keep_originals"],
+        )
+
+    def dry_run(self, plan, base_dir):
+        return dry_run(plan, Path(base_dir), self.options["distributor"]["keep_originals"])
+
+    def run(self, input_dir, progress_callback=None, cancel_event=None, report=None, cluster_offset=1):
+        plan = self.plan(input_dir, progress_callback, cancel_event)
+        renumber_clusters(plan, start=cluster_offset)
+        moved, copied = self.distribute(plan, input_dir, report)
+        return plan, moved, copied
+
+def build_plan_legacy(input_dir, det_size=(1024, 1024), dbscan_eps=DBSCAN_EPS, dbscan_min_samples=2, largest_face=False, progress_callback=None):
+    # интерфейс первых версий приложения: DBSCAN, только план, без распределения
+    pipeline = Pipeline(
+        detector={"det_size": det_size},
+        embedder={"largest_face": largest_face},
+        clusterer={"method": "dbscan", "eps": dbscan_eps, "min_samples": dbscan_min_samples, "min_cluster_size": 1},
+    )
+    return pipeline.plan(input_dir, progress_callback)
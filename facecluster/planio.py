@@ -0,0 +1,266 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+PLAN_FORMAT = "face-plan"
+PLAN_VERSION = 1
+PLAN_SUFFIXES = {"json": ".json", "ndjson": ".ndjson", "npz": ".npz"}
+LIST_KEYS = ("unreadable", "no_faces", "skipped_small")
+SEP = "\0"  # не может встретиться в пути ни в одной ОС
+FACE_KEYS = ("path", "bbox", "det_score", "cluster", "prob", "embedding_row")
+
+def plan_file_name(name, fmt="npz"):
+    return f"plan_{name}{PLAN_SUFFIXES[fmt]}"
+
+def plan_format(path: Path):
+    suffix = Path(path).suffix.lower()
+    for fmt, ext in PLAN_SUFFIXES.items():
+        if suffix == ext:
+            return fmt
+    raise ValueError(f"{path}: неизвестный формат плана (ожидается {', '.join(PLAN_SUFFIXES.values())})")
+
+def _extra(plan):
+    return {k: v for k, v in plan.items() if k not in ("clusters", "plan", "faces", "embeddings", *LIST_KEYS)}
+
+def iter_faces(faces):
+    # столбцы faces → по словарю на лицо
+    for row in zip(*(faces[key] for key in FACE_KEYS)):
+        yield dict(zip(FACE_KEYS, row))
+
+def faces_from_rows(rows):
+    faces = {key: [] for key in FACE_KEYS}
+    for row in rows:
+        for key in FACE_KEYS:
+            faces[key].append(row[key])
+    return faces
+
+def clusters_from_entries(entries):
+    # "clusters" в плане — обратное отображение "plan", поэтому в компактных форматах не хранится
+    clusters = {}
+    for entry in entries:
+        for cid in entry["cluster"]:
+            clusters.setdefault(int(cid), []).append(entry["path"])
+    return {cid: sorted(paths) for cid, paths in clusters.items()}
+
+def _json_shape(entries, lists, extra, faces=None):
+    plan = {"clusters": clusters_from_entries(entries), "plan": entries}
+    for key in LIST_KEYS:
+        if key in lists:
+            plan[key] = lists[key]
+    if faces is not None:
+        plan["faces"] = faces
+    plan.update(extra)
+    if "names" in plan:
+        plan["names"] = {int(k): v for k, v in plan["names"].items()}
+    return plan
+
+class PlanWriter:
+    # потоковая запись NDJSON: заголовок, затем по строке на изображение — весь план в памяти не нужен
+    def __init__(self, path: Path, meta=None):
+        self.path = Path(path)
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._write({"format": PLAN_FORMAT, "version": PLAN_VERSION, **(meta or {})})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+
+    def add(self, path, clusters):
+        self._write({"path": str(path), "cluster": [int(c) for c in clusters]})
+
+    def add_list(self, key, path):
+        self._write({key: str(path)})
+
+    def add_face(self, face):
+        self._write({"face": face})
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_plan_ndjson(path: Path):
+    # ("header", dict), затем ("plan", {"path", "cluster"}), ("face", {...}) или (unreadable|no_faces|skipped_small, путь)
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != PLAN_FORMAT:
+            raise ValueError(f"{path}: не файл плана")
+        yield "header", header
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "path" in record:
+                yield "plan", record
+            else:
+                key, value = next(iter(record.items()))
+                yield key, value
+
+def write_plan_ndjson(plan, path: Path):
+    meta = {"lists": [key for key in LIST_KEYS if key in plan], **_extra(plan)}
+    if "faces" in plan:
+        meta["faces"] = True
+    with PlanWriter(path, meta) as writer:
+        for entry in plan.get("plan", []):
+            writer.add(entry["path"], entry["cluster"])
+        for key in LIST_KEYS:
+            for p in plan.get(key, []):
+                writer.add_list(key, p)
+        for face in iter_faces(plan.get("faces") or {key: [] for key in FACE_KEYS}):
+            writer.add_face(face)
+
+def read_plan_ndjson(path: Path):
+    entries, lists, extra, faces = [], {}, {}, None
+    for kind, value in iter_plan_ndjson(path):
+        if kind == "header":
+            extra = {k: v for k, v in value.items() if k not in ("format", "version", "lists", "faces")}
+            lists = {key: [] for key in value.get("lists", [])}
+            faces = [] if value.get("faces") else None
+        elif kind == "plan":
+            entries.append(value)
+        elif kind == "face":
+            faces.append(value)
+        else:
+            lists.setdefault(kind, []).append(value)
+    return _json_shape(entries, lists, extra, None if faces is None else faces_from_rows(faces))
+
+def _pack_strings(strings):
+    return np.frombuffer(SEP.join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _unpack_strings(blob, count):
+    if not count:
+        return []
+    return blob.tobytes().decode("utf-8").split(SEP)
+
+def _face_arrays(faces, idx):
+    return {
+        "face_path": np.array([idx(p) for p in faces["path"]], dtype=np.int32),
+        "face_bbox": np.array(faces["bbox"], dtype=np.float32).reshape(-1, 4),
+        "face_det_score": np.array(faces["det_score"], dtype=np.float32),
+        "face_cluster": np.array(faces["cluster"], dtype=np.int32),
+        "face_prob": np.array(faces["prob"], dtype=np.float32),
+        "face_embedding_row": np.array(faces["embedding_row"], dtype=np.int32),
+    }
+
+def write_plan_npz(plan, path: Path, arrays=None):
+    # таблица путей (одна строка байт) + целочисленные массивы: план на 200k фото — единицы МБ.
+    # Таблица лиц и эмбеддинги (float16) — отдельные массивы, читаются без разбора остального плана
+    paths, index = [], {}
+
+    def idx(p):
+        if p not in index:
+            index[p] = len(paths)
+            paths.append(p)
+        return index[p]
+
+    entries = plan.get("plan", [])
+    plan_paths = np.array([idx(e["path"]) for e in entries], dtype=np.int32)
+    indptr = np.zeros(len(entries) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(e["cluster"]) for e in entries])
+    cluster_ids = np.array([c for e in entries for c in e["cluster"]], dtype=np.int32)
+    lists = {key: np.array([idx(p) for p in plan[key]], dtype=np.int32) for key in LIST_KEYS if key in plan}
+    arrays = dict(arrays or {})
+    if "faces" in plan:
+        arrays.update(_face_arrays(plan["faces"], idx))
+    if plan.get("embeddings") is not None:
+        arrays["embeddings"] = np.asarray(plan["embeddings"], dtype=np.float16)
+
+    meta = {"format": PLAN_FORMAT, "version": PLAN_VERSION, "paths": len(paths), "lists": sorted(lists), **_extra(plan)}
+    with open(path, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            paths=_pack_strings(paths),
+            plan_paths=plan_paths,
+            cluster_indptr=indptr,
+            cluster_ids=cluster_ids,
+            **{f"list_{key}": value for key, value in lists.items()},
+            **arrays,
+        )
+
+def read_plan_arrays(path: Path):
+    # без сборки словарей: для инструментов, которым достаточно массивов
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format") != PLAN_FORMAT:
+            raise ValueError(f"{path}: не файл плана")
+        if meta.get("version", 0) > PLAN_VERSION:
+            raise ValueError(f"{path}: версия плана {meta['version']} новее поддерживаемой {PLAN_VERSION}")
+        arrays = {key: data[key] for key in data.files if key not in ("meta", "paths")}
+        paths = _unpack_strings(data["paths"], meta["paths"])
+    return meta, paths, arrays
+
+def read_plan_npz(path: Path):
+    meta, paths, arrays = read_plan_arrays(path)
+    indptr = arrays["cluster_indptr"].tolist()
+    ids = arrays["cluster_ids"].tolist()
+    entries = [
+        {"path": paths[p], "cluster": ids[indptr[i]:indptr[i + 1]]}
+        for i, p in enumerate(arrays["plan_paths"].tolist())
+    ]
+    lists = {key: [paths[i] for i in arrays[f"list_{key}"].tolist()] for key in meta.get("lists", [])}
+    extra = {k: v for k, v in meta.items() if k not in ("format", "version", "paths", "lists")}
+    faces = None
+    if "face_path" in arrays:
+        faces = {
+            "path": [paths[i] for i in arrays["face_path"].tolist()],
+            "bbox": np.round(arrays["face_bbox"].astype(np.float64), 1).tolist(),
+            "det_score": np.round(arrays["face_det_score"].astype(np.float64), 4).tolist(),
+            "cluster": arrays["face_cluster"].tolist(),
+            "prob": np.round(arrays["face_prob"].astype(np.float64), 4).tolist(),
+            "embedding_row": arrays["face_embedding_row"].tolist(),
+        }
+    return _json_shape(entries, lists, extra, faces)
+
+def load_embeddings(path: Path):
+    # эмбеддинги лиц из .npz-плана (строки — faces["embedding_row"]) или None, если их не сохраняли
+    if plan_format(path) != "npz":
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return data["embeddings"] if "embeddings" in data.files else None
+
+def save_plan(plan, path: Path, fmt=None):
+    path = Path(path)
+    fmt = fmt or plan_format(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "npz":
+        write_plan_npz(plan, path)
+    elif fmt == "ndjson":
+        write_plan_ndjson(plan, path)
+    else:
+        # эмбеддинги в JSON не пишутся: это 512 чисел на лицо
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in plan.items() if k != "embeddings"}, f, ensure_ascii=False)
+    return path
+
+def load_plan(path: Path):
+    # всегда возвращает привычную форму: {"clusters": {id: [пути]}, "plan": [...], "unreadable": [...], ...}
+    fmt = plan_format(path)
+    if fmt == "npz":
+        return read_plan_npz(path)
+    if fmt == "ndjson":
+        return read_plan_ndjson(path)
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    plan["clusters"] = {int(k): v for k, v in plan.get("clusters", {}).items()}
+    if "names" in plan:
+        plan["names"] = {int(k): v for k, v in plan["names"].items()}
+    return plan
+
+def convert_plan(src: Path, dst: Path, indent=None):
+    plan = load_plan(src)
+    if plan_format(dst) == "npz":
+        embeddings = load_embeddings(src)
+        if embeddings is not None:
+            plan["embeddings"] = embeddings
+    if plan_format(dst) == "json" and indent:
+        Path(dst).parent.mkdir(parents=True, exist_ok=True)
+        with open(dst, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=indent)
+        return Path(dst)
+    return save_plan(plan, dst)
@@ -0,0 +1,192 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import onnxruntime as ort
+
+SAMPLE_INTERVAL = 0.01  # 100 Гц: доли процента накладных расходов на фоне детектора
+PROFILE_MODES = ("sample", "cprofile", "onnx")
+
+class StageTimers:
+    # накопительные таймеры стадий; пишутся и из потоков декодирования, поэтому под замком
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            s = self.stats.setdefault(name, [0, 0.0, 0.0])
+            s[0] += 1
+            s[1] += seconds
+            s[2] = max(s[2], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def wrap(self, fn, name):
+        def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - started)
+        return timed_call
+
+    def summary(self):
+        with self._lock:
+            stats = {name: list(s) for name, s in self.stats.items()}
+        # выравнивание лица = get распознавания минус сам прогон сети
+        if "recognition" in stats and "recognition.onnx" in stats:
+            calls, total, _ = stats["recognition"]
+            stats["alignment"] = [calls, max(total - stats["recognition.onnx"][1], 0.0), 0.0]
+        return {
+            name: {"calls": calls, "total_s": round(total, 4), "mean_ms": round(total / calls * 1000, 3) if calls else 0.0, "max_ms": round(peak * 1000, 3)}
+            for name, (calls, total, peak) in sorted(stats.items())
+        }
+
+def timed(timers, name):
+    return timers.stage(name) if timers is not None else nullcontext()
+
+class StackSampler(threading.Thread):
+    # стеки всех потоков раз в interval секунд; результат — «свёрнутые» стеки, как у py-spy --format raw:
+    # открываются speedscope, inferno и flamegraph.pl
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(f"thread {names.get(ident, ident)}")
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path: Path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _instrument(app, timers, onnx_prefix=None):
+    # детектор и каждая модель после него — отдельные таймеры, session.run — чистое время сети.
+    # Возвращает список откатов: модель может быть общей для следующих задач
+    undo = []
+    for task, model in getattr(app, "models", {}).items():
+        session = getattr(model, "session", None)
+        if session is not None and onnx_prefix is not None:
+            opts = session.get_session_options()
+            opts.enable_profiling = True
+            opts.profile_file_prefix = f"{onnx_prefix}_{task}"
+            model.session = ort.InferenceSession(model.model_file, sess_options=opts, providers=session.get_providers())
+            undo.append(lambda model=model, session=session: setattr(model, "session", session))
+        session = getattr(model, "session", None)
+        if session is not None:
+            had_run = "run" in vars(session)
+            original_run = session.run
+            session.run = timers.wrap(original_run, f"{task}.onnx")
+            undo.append(lambda session=session, original=original_run, had=had_run: setattr(session, "run", original) if had else delattr(session, "run"))
+        method = "detect" if task == "detection" else "get"
+        if hasattr(model, method):
+            had = method in vars(model)
+            original = getattr(model, method)
+            setattr(model, method, timers.wrap(original, task))
+            undo.append(lambda model=model, method=method, original=original, had=had: setattr(model, method, original) if had else delattr(model, method))
+    return undo
+
+class RunProfiler:
+    # всё в run_dir: timers.json всегда, stacks.txt (sample), profile.pstats (cprofile), onnx_*.json (onnx)
+    def __init__(self, run_dir: Path, modes=(), interval=SAMPLE_INTERVAL):
+        unknown = sorted(set(modes) - set(PROFILE_MODES))
+        if unknown:
+            raise ValueError(f"неизвестные режимы профилирования: {', '.join(unknown)}; допустимы: {', '.join(PROFILE_MODES)}")
+        self.run_dir = Path(run_dir)
+        self.modes = set(modes)
+        self.interval = interval
+        self.timers = StageTimers()
+        self.meta = {}
+
+    @contextmanager
+    def run(self, app):
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        sampler = StackSampler(self.interval) if "sample" in self.modes else None
+        profile = cProfile.Profile() if "cprofile" in self.modes else None
+        onnx_prefix = str(self.run_dir / "onnx") if "onnx" in self.modes else None
+        undo = _instrument(app, self.timers, onnx_prefix)
+        onnx_files = []
+        started = time.perf_counter()
+        if sampler is not None:
+            sampler.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+            if sampler is not None:
+                sampler.stop()
+            self.timers.add("total", time.perf_counter() - started)
+            if onnx_prefix is not None:
+                for model in getattr(app, "models", {}).values():
+                    if getattr(model, "session", None) is not None:
+                        onnx_files.append(Path(model.session.end_profiling()).name)
+            for restore in reversed(undo):
+                restore()
+            self._write(sampler, profile, onnx_files)
+
+    def _write(self, sampler, profile, onnx_files):
+        files = {"timers": "timers.json"}
+        if sampler is not None:
+            sampler.write(self.run_dir / "stacks.txt")
+            files["stacks"] = "stacks.txt"
+        if profile is not None:
+            profile.dump_stats(str(self.run_dir / "profile.pstats"))
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(40)
+            (self.run_dir / "profile.txt").write_text(text.getvalue(), encoding="utf-8")
+            files["cprofile"] = "profile.pstats"
+        if onnx_files:
+            files["onnx"] = onnx_files
+        report = {
+            "host": socket.gethostname(),
+            "cpus": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **self.meta,
+            "stages": self.timers.summary(),
+            "samples": sampler.samples if sampler is not None else None,
+            "files": files,
+        }
+        with open(self.run_dir / "timers.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+def profile_run_dir(base: Path, name):
+    return Path(base) / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}"
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+
+REFRESH_INTERVAL = 0.5  # не чаще двух перерисовок в секунду: на мелких фото сканирование быстрее, чем отрисовка
+QUEUE_SIZE = 1024
+STAGE_LABELS = {"scan": "📷 Scanning"}
+
+def format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def format_event(event):
+    # событие → строка, как раньше писал build_plan_live; для сообщений стадий — сам текст
+    if not event.get("total"):
+        return event.get("message") or ""
+    done, total = event["done"], event["total"]
+    percent = int(done / total * 100)
+    bar = int(percent / 2) * "█"
+    line = f"{STAGE_LABELS.get(event['stage'], event['stage'])}: {percent}%|{bar:<50}| {done}/{total}"
+    extra = []
+    if event.get("rate"):
+        extra.append(f"{event['rate']:.1f}/с")
+    if done < total:
+        extra.append(f"осталось {format_eta(event.get('eta'))}")
+    if event.get("faces") is not None:
+        extra.append(f"лиц: {event['faces']}")
+    return f"{line} {', '.join(extra)}" if extra else line
+
+class ProgressChannel:
+    # события прогресса (stage, done/total, rate, eta, faces) из любого потока кладутся в очередь,
+    # потребитель забирает их пачкой и показывает только последнее.
+    # sink=None — очередь читает UI (latest()); иначе sink(строка) вызывается не чаще раза в interval:
+    # из своего потока (background=True, CLI) или прямо из производителя (st.empty() — только из потока скрипта).
+    # Интерфейс .text(...) сохранён: всё, что раньше принимало progress_callback, принимает и канал
+    def __init__(self, sink=None, interval=REFRESH_INTERVAL, background=True):
+        self.sink = sink
+        self.interval = interval
+        self.shown = 0
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._last = None
+        self._last_shown = None
+        self._flushed = 0.0
+        self._stages = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        if sink is not None and background:
+            self._thread = threading.Thread(target=self._consume, name="progress", daemon=True)
+            self._thread.start()
+
+    def update(self, stage, done, total, faces=None):
+        now = time.perf_counter()
+        # скорость и остаток — от первого события стадии, чтобы загрузка модели не портила оценку
+        started, done0 = self._stages.setdefault(stage, (now, done))
+        rate = (done - done0) / (now - started) if now > started and done > done0 else None
+        event = {"stage": stage, "done": done, "total": total, "rate": rate, "eta": (total - done) / rate if rate else None, "faces": faces, "time": time.time()}
+        self._publish(event, force=done >= total)
+
+    def text(self, message):
+        # сообщения стадий редки и показываются сразу
+        self._publish({"stage": None, "message": message, "time": time.time()}, force=True)
+
+    def _publish(self, event, force=False):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                break
+            except queue.Full:
+                # никто не читает: старые события не нужны
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+        if self.sink is not None and self._thread is None and (force or time.perf_counter() - self._flushed >= self.interval):
+            self.flush()
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def latest(self):
+        with self._lock:
+            events = self.drain()
+            if events:
+                self._last = events[-1]
+            return self._last
+
+    def flush(self):
+        event = self.latest()
+        with self._lock:
+            if event is None or event is self._last_shown:
+                return
+            self._last_shown = event
+            self._flushed = time.perf_counter()
+            self.shown += 1
+        self.sink(format_event(event))
+
+    def _consume(self):
+        while not self._stop_event.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        # последнее событие показывается всегда
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        if self.sink is not None:
+            self.flush()
+
+def as_progress(progress_callback, interval=REFRESH_INTERVAL):
+    # старый progress_callback с одним .text(...) (st.empty() и т. п.) — через канал с прореживанием в том же потоке
+    if progress_callback is None or isinstance(progress_callback, ProgressChannel):
+        return progress_callback
+    return ProgressChannel(progress_callback.text, interval, background=False)
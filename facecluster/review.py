@@ -0,0 +1,108 @@
+import numpy as np
+from sklearn.cluster import KMeans
+
+from facecluster.planio import clusters_from_entries
+
+MERGE_SIMILARITY = 0.55  # косинус между центрами кластеров, выше — вероятно, один человек
+SPLIT_SPREAD = 0.45  # средний (1 − косинус) лица к центру своего кластера, выше — кластер подозрительно широк
+SPLIT_MIN_FACES = 6  # меньшие кластеры не делятся: половинки были бы меньше min_cluster_size
+
+def _normalize(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.maximum(np.linalg.norm(v, axis=-1, keepdims=True), 1e-12)
+
+def _face_rows(plan, embeddings):
+    faces = plan.get("faces")
+    if faces is None or embeddings is None:
+        raise ValueError("в плане нет эмбеддингов лиц: постройте его с --keep-embeddings")
+    return np.asarray(faces["cluster"], dtype=np.int64), np.asarray(faces["embedding_row"], dtype=np.int64)
+
+def cluster_centroids(plan, embeddings):
+    # (номера кластеров, нормированные центры, число лиц, разброс): одним проходом np.add.at по всем лицам
+    labels, rows = _face_rows(plan, embeddings)
+    keep = labels != -1
+    cids, inverse = np.unique(labels[keep], return_inverse=True)
+    X = _normalize(embeddings[rows[keep]])
+    sums = np.zeros((len(cids), X.shape[1]), dtype=np.float64)
+    np.add.at(sums, inverse, X)
+    sizes = np.bincount(inverse, minlength=len(cids))
+    centroids = _normalize(sums)
+    spread = np.bincount(inverse, weights=1 - np.einsum("ij,ij->i", X, centroids[inverse]), minlength=len(cids)) / np.maximum(sizes, 1)
+    return cids, centroids, sizes, spread
+
+def suggest_merges(plan, embeddings, threshold=MERGE_SIMILARITY):
+    # пары кластеров с близкими центрами, по убыванию сходства; матрица сходства — одно C @ C.T
+    cids, centroids, sizes, _ = cluster_centroids(plan, embeddings)
+    sim = centroids @ centroids.T
+    a, b = np.nonzero(np.triu(sim >= threshold, 1))
+    order = np.argsort(-sim[a, b], kind="stable")
+    names = plan.get("names", {})
+    suggestions = []
+    for i, j in zip(a[order], b[order]):
+        x, y = int(cids[i]), int(cids[j])
+        if x in names and y in names and names[x] != names[y]:
+            continue  # два разных известных человека не объединяются
+        suggestions.append({"clusters": [x, y], "similarity": round(float(sim[i, j]), 4), "faces": [int(sizes[i]), int(sizes[j])]})
+    return suggestions
+
+def suggest_splits(plan, embeddings, spread=SPLIT_SPREAD, min_faces=SPLIT_MIN_FACES, seed=0):
+    # широкие кластеры делятся k-means надвое: если половинки далеки друг от друга, в кластере, скорее всего, двое
+    cids, centroids, sizes, spreads = cluster_centroids(plan, embeddings)
+    labels, rows = _face_rows(plan, embeddings)
+    suggestions = []
+    for i in np.flatnonzero((spreads >= spread) & (sizes >= min_faces)):
+        X = _normalize(embeddings[rows[labels == cids[i]]])
+        parts = KMeans(2, n_init=3, random_state=seed).fit_predict(X)
+        halves = _normalize(np.array([X[parts == k].mean(axis=0) for k in (0, 1)]))
+        suggestions.append({
+            "cluster": int(cids[i]),
+            "faces": int(sizes[i]),
+            "spread": round(float(spreads[i]), 4),
+            "parts": np.bincount(parts, minlength=2).tolist(),
+            "similarity": round(float(halves[0] @ halves[1]), 4),
+        })
+    return sorted(suggestions, key=lambda s: s["similarity"])
+
+def merge_clusters(plan, groups):
+    # объединяет группы кластеров прямо в плане: [[3, 7], [7, 12]] → 3, 7, 12 становятся одним кластером.
+    # Номер — у известного по галерее, иначе наименьший; фото, бывшее в двух слитых кластерах, попадает в один.
+    # Возвращает {старый номер: новый}
+    parent = {}
+
+    def root(c):
+        parent.setdefault(c, c)
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    for group in groups:
+        group = [int(c) for c in group]
+        for c in group:
+            parent[root(c)] = root(group[0])
+    # опечатка в номере не должна молча оставлять план как есть — проверяются все номера, даже одиночные
+    missing = sorted(set(parent) - set(plan.get("clusters", {})))
+    if missing:
+        raise ValueError(f"в плане нет кластеров {', '.join(map(str, missing))}")
+    names = plan.get("names", {})
+    members = {}
+    for c in list(parent):
+        members.setdefault(root(c), []).append(c)
+    mapping = {}
+    for group in members.values():
+        named = sorted({names[c] for c in group if c in names})
+        if len(named) > 1:
+            raise ValueError(f"кластеры {sorted(group)} — разные известные люди: {', '.join(named)}")
+        target = min((c for c in group if c in names), default=min(group))
+        mapping.update({c: target for c in group if c != target})
+    if not mapping:
+        return mapping
+
+    for entry in plan.get("plan", []):
+        entry["cluster"] = sorted({mapping.get(int(c), int(c)) for c in entry["cluster"]})
+    plan["clusters"] = clusters_from_entries(plan.get("plan", []))
+    if "faces" in plan:
+        plan["faces"]["cluster"] = [mapping.get(int(c), int(c)) for c in plan["faces"]["cluster"]]
+    if names:
+        plan["names"] = {c: name for c, name in names.items() if c not in mapping}
+    return mapping
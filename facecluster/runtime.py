@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import onnxruntime as ort
+
+# landmark_2d_106, landmark_3d_68 и genderage для кластеризации не нужны, а app.get гоняет их на каждом лице
+DEFAULT_MODULES = ("detection", "recognition")
+
+GRAPH_OPT_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+def session_options(intra_op_threads=0, inter_op_threads=0, graph_opt="all", execution_mode="sequential"):
+    # 0 потоков — значение ONNX Runtime по умолчанию (все физические ядра)
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = int(intra_op_threads)
+    opts.inter_op_num_threads = int(inter_op_threads)
+    opts.graph_optimization_level = GRAPH_OPT_LEVELS[graph_opt]
+    opts.execution_mode = EXECUTION_MODES[execution_mode]
+    return opts
+
+def apply_session_options(app, opts, providers):
+    # insightface не пробрасывает sess_options в InferenceSession, поэтому сессии пересоздаются
+    # из тех же .onnx; имена входов/выходов, прочитанные моделью при создании, остаются валидными
+    for model in app.models.values():
+        model.session = ort.InferenceSession(model.model_file, sess_options=opts, providers=providers)
+
+def quantize_recognition(src: Path, dst: Path):
+    # динамическая INT8-квантизация весов: заметно быстрее на CPU, точность проверять bench.py models
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+    return dst
@@ -0,0 +1,165 @@
+import json
+import socket
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from facecluster.cluster import DBSCAN_EPS, EMBEDDING_DIM, MATCH_THRESHOLD, MICRO_RADIUS, cluster_scan, list_images, load_model, open_spill, scan_images
+from facecluster.media import FRAME_STRIDE
+
+SHARD_FORMAT = "face-embedding-shard"
+SHARD_VERSION = 1
+
+def _rel(path: Path, root: Path) -> str:
+    return path.relative_to(root).as_posix()
+
+def shard_of(rel_path: str, count: int) -> int:
+    # по хэшу относительного пути: шард файла не меняется, когда в папку добавляют новые фото,
+    # и совпадает на узлах, где NAS смонтирован по разным путям
+    return zlib.crc32(rel_path.encode("utf-8")) % count
+
+def select_shard(all_images, root: Path, index: int, count: int):
+    return [p for p in all_images if shard_of(_rel(p, root), count) == index]
+
+def save_shard(out_path: Path, meta, images, scan, root: Path):
+    index = {p: i for i, p in enumerate(images)}
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "wb") as f:
+        np.savez(
+            f,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            images=np.array([_rel(p, root) for p in images], dtype=str),
+            embeddings=np.asarray(scan["embeddings"], dtype=np.float32),
+            owners=np.array([index[p] for p in scan["owners"]], dtype=np.int32),
+            bboxes=np.asarray(scan["bboxes"], dtype=np.float32).reshape(-1, 4),
+            det_scores=np.asarray(scan["det_scores"], dtype=np.float32),
+            unreadable=np.array([index[p] for p in scan["unreadable"]], dtype=np.int32),
+            no_faces=np.array([index[p] for p in scan["no_faces"]], dtype=np.int32),
+            skipped_small=np.array([index[p] for p in scan.get("skipped_small", [])], dtype=np.int32),
+        )
+    return out_path
+
+def load_shard(path: Path):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format") != SHARD_FORMAT:
+            raise ValueError(f"{path}: не файл шарда эмбеддингов")
+        if meta.get("version", 0) > SHARD_VERSION:
+            raise ValueError(f"{path}: версия шарда {meta['version']} новее поддерживаемой {SHARD_VERSION}")
+        return {
+            "meta": meta,
+            "images": [str(x) for x in data["images"]],
+            "embeddings": data["embeddings"],
+            "owners": data["owners"],
+            # шарды, записанные до появления таблицы лиц: рамки нулевые, уверенность детектора неизвестна
+            "bboxes": data["bboxes"] if "bboxes" in data.files else np.zeros((len(data["owners"]), 4), dtype=np.float32),
+            "det_scores": data["det_scores"] if "det_scores" in data.files else np.zeros(len(data["owners"]), dtype=np.float32),
+            "unreadable": data["unreadable"],
+            "no_faces": data["no_faces"],
+            "skipped_small": data["skipped_small"] if "skipped_small" in data.files else np.zeros(0, dtype=np.int32),
+        }
+
+def scan_shard(input_dir: Path, out_path: Path, index=0, count=1, det_size=(1024, 1024), progress_callback=None, workers=1, batch_size=16, model_options=None, min_side=0, max_side=None, largest_face=False, videos=False, video_stride=FRAME_STRIDE, bursts=False):
+    root = Path(input_dir)
+    started = time.time()
+    model_options = model_options or {}
+    images = select_shard(sorted(list_images(root, videos)), root, index, count)
+    app = load_model(det_size, **model_options)
+    scan = scan_images(images, app, progress_callback, workers, batch_size, min_side=min_side, max_side=max_side, largest_face=largest_face, bursts=bursts, video_stride=video_stride)
+    meta = {
+        "format": SHARD_FORMAT,
+        "version": SHARD_VERSION,
+        "input_dir": str(root),
+        "shard": index,
+        "shards": count,
+        "model": model_options.get("model_pack", "buffalo_l"),
+        "rec_model": Path(model_options["rec_model"]).name if model_options.get("rec_model") else None,
+        "det_size": list(det_size),
+        "embedding_dim": int(scan["embeddings"].shape[1]),
+        "images": len(images),
+        "faces": int(len(scan["embeddings"])),
+        "min_side": min_side,
+        "max_side": max_side,
+        "largest_face": largest_face,
+        "video_stride": video_stride if videos else None,
+        "bursts": bursts,
+        "host": socket.gethostname(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": round(time.time() - started, 3),
+    }
+    if scan.get("media"):
+        meta["media"] = scan["media"]
+    save_shard(out_path, meta, images, scan, root)
+    return meta
+
+def merge_shards(shard_paths, root=None, min_cluster_size=3, min_samples=1, min_prob_threshold=0.85, memory_budget_mb=None, spill_dir=None, progress_callback=None, keep_faces=False, keep_embeddings=False, method="hdbscan", micro_radius=MICRO_RADIUS, gallery=None, match_threshold=MATCH_THRESHOLD, eps=DBSCAN_EPS):
+    shards = [load_shard(Path(p)) for p in shard_paths]
+    if not shards:
+        raise ValueError("не указано ни одного шарда")
+
+    first = shards[0]["meta"]
+    count = first["shards"]
+    seen = {}
+    # input_dir не сравнивается: узлы могут монтировать один NAS по разным путям, пути в шардах относительные.
+    # Параметры чтения и детекции меняют сами эмбеддинги — такие шарды смешивать нельзя
+    input_dirs = {shard["meta"].get("input_dir") for shard in shards}
+    if root is None and len(input_dirs) > 1:
+        raise ValueError(f"шарды сняты с разных путей ({', '.join(sorted(map(str, input_dirs)))}) — укажите --root")
+    for path, shard in zip(shard_paths, shards):
+        meta = shard["meta"]
+        for key in ("shards", "model", "rec_model", "det_size", "embedding_dim", "min_side", "max_side", "largest_face", "bursts", "video_stride"):
+            if meta.get(key) != first.get(key):
+                raise ValueError(f"{path}: {key}={meta.get(key)!r} не совпадает с {first.get(key)!r}")
+        if meta["shard"] in seen:
+            raise ValueError(f"{path}: шард {meta['shard']} уже загружен из {seen[meta['shard']]}")
+        seen[meta["shard"]] = path
+    missing = sorted(set(range(count)) - set(seen))
+    if missing:
+        raise ValueError(f"не хватает шардов: {', '.join(f'{i}/{count}' for i in missing)}")
+
+    shards.sort(key=lambda shard: shard["meta"]["shard"])
+
+    # пути в шардах относительные — root позволяет смонтировать NAS по другому пути на узле слияния
+    root = Path(root or first["input_dir"])
+    spill = open_spill(memory_budget_mb, spill_dir)
+    try:
+        embeddings, owners, unreadable, no_faces, skipped_small, all_images = [], [], [], [], [], []
+        bboxes, det_scores = [], []
+        for shard in shards:
+            paths = [root / rel for rel in shard["images"]]
+            all_images.extend(paths)
+            if spill is not None:
+                spill.append(shard["embeddings"])
+            else:
+                embeddings.append(shard["embeddings"])
+            owners.extend(paths[i] for i in shard["owners"])
+            bboxes.append(shard["bboxes"])
+            det_scores.append(shard["det_scores"])
+            unreadable.extend(paths[i] for i in shard["unreadable"])
+            no_faces.extend(paths[i] for i in shard["no_faces"])
+            skipped_small.extend(paths[i] for i in shard["skipped_small"])
+            shard.clear()
+
+        if spill is not None:
+            X = spill.finish()
+        else:
+            X = np.vstack(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        scan = {
+            "embeddings": X,
+            "owners": owners,
+            "bboxes": np.vstack(bboxes),
+            "det_scores": np.concatenate(det_scores),
+            "unreadable": unreadable,
+            "no_faces": no_faces,
+            "skipped_small": skipped_small,
+        }
+        all_images.sort(key=str)
+        plan = cluster_scan(all_images, scan, min_cluster_size, min_samples, min_prob_threshold, memory_budget_mb, progress_callback, keep_faces, keep_embeddings, method, micro_radius, gallery, match_threshold, eps)
+        del scan, X
+        return plan, root
+    finally:
+        if spill is not None:
+            spill.remove()
@@ -0,0 +1,140 @@
+import time
+from importlib import metadata
+from itertools import product
+from pathlib import Path
+
+import hdbscan
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import DBSCAN
+
+from facecluster.twostage import KNN_BLOCK_CELLS, KNN_NEIGHBORS, knn_graph
+
+SWEEP_MIN_CLUSTER_SIZES = (2, 3, 5, 8)
+SWEEP_MIN_SAMPLES = (1, 2, 3)
+SWEEP_MIN_PROBS = (0.0, 0.5, 0.85)
+SWEEP_EPS = (0.3, 0.4, 0.5, 0.6)
+HDBSCAN_TESTED = "0.8.44"  # версия hdbscan, с которой проверено «сжатие» готового дерева
+
+try:
+    from hdbscan.hdbscan_ import _tree_to_labels
+except ImportError:  # закрытая функция hdbscan: в другой версии её может не быть
+    _tree_to_labels = None
+
+def load_sweep_embeddings(paths):
+    # эмбеддинги из .npz-планов (сохранённых с --keep-embeddings) и шардов: в обоих лежат под ключом embeddings
+    parts = []
+    for path in paths:
+        with np.load(Path(path), allow_pickle=False) as data:
+            if "embeddings" not in data.files:
+                raise ValueError(f"{path}: нет эмбеддингов — план нужно сохранить с --keep-embeddings")
+            parts.append(np.asarray(data["embeddings"], dtype=np.float32))
+    X = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+    # float16 в плане слегка сбивает норму
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+def _summary(labels, probabilities, min_cluster_size, min_prob):
+    # те же фильтры, что в cluster_scan: порог вероятности, затем размер кластера (здесь — в лицах, а не в фото)
+    n = len(labels)
+    keep = (labels != -1) & (probabilities >= min_prob)
+    sizes = np.bincount(labels[keep]) if keep.any() else np.zeros(0, dtype=np.int64)
+    valid = sizes >= min_cluster_size
+    clustered = int(sizes[valid].sum())
+    return {
+        "clusters": int(valid.sum()),
+        "noise": round(1 - clustered / n, 4) if n else 0.0,
+        "largest": round(int(sizes.max()) / n, 4) if valid.any() else 0.0,
+    }
+
+def hdbscan_trees(X, min_samples_values, exact=False, progress_callback=None):
+    # дерево single linkage зависит только от min_samples; min_cluster_size лишь по-разному его «сжимает».
+    # Граф соседей строится один раз на все min_samples: соседей берётся с запасом под наибольший
+    graph = None if exact else knn_graph(X, max(KNN_NEIGHBORS, max(min_samples_values) + 2))
+    trees = {}
+    for ms in min_samples_values:
+        if progress_callback:
+            progress_callback.text(f"🌳 Дерево HDBSCAN для min_samples={ms} ({len(X)} лиц)")
+        if exact:
+            model = hdbscan.HDBSCAN(min_cluster_size=2, min_samples=ms, metric="euclidean").fit(X)
+        else:
+            model = hdbscan.HDBSCAN(min_cluster_size=2, min_samples=ms, metric="precomputed").fit(graph)
+        trees[ms] = model.single_linkage_tree_.to_numpy()
+    return trees
+
+def _installed_hdbscan():
+    try:
+        return metadata.version("hdbscan")
+    except metadata.PackageNotFoundError:
+        return "?"
+
+def condense_labels(tree, min_cluster_size):
+    # метки, вероятности и устойчивости кластеров по готовому дереву single linkage. Публичного API для этого
+    # в hdbscan нет, поэтому несовместимая версия даёт понятную ошибку, а не сбой распаковки кортежа
+    try:
+        if _tree_to_labels is None:
+            raise TypeError("нет hdbscan.hdbscan_._tree_to_labels")
+        result = _tree_to_labels(None, tree, min_cluster_size)
+        labels, probabilities, stabilities = result[:3]
+        if len(labels) != len(tree) + 1:
+            raise TypeError("неожиданный результат _tree_to_labels")
+    except (TypeError, ValueError) as e:
+        raise RuntimeError(f"sweep несовместим с установленным hdbscan {_installed_hdbscan()} ({e}); "
+                           f"проверено с hdbscan=={HDBSCAN_TESTED}, можно использовать --method dbscan") from e
+    return labels, probabilities, stabilities
+
+def sweep_hdbscan(X, min_cluster_sizes=SWEEP_MIN_CLUSTER_SIZES, min_samples_values=SWEEP_MIN_SAMPLES, min_probs=SWEEP_MIN_PROBS, exact=False, progress_callback=None):
+    # одна строка на сочетание параметров; stability — сумма устойчивостей выбранных кластеров (чем выше, тем
+    # отчётливее кластеры), mean_stability — на кластер. Порог вероятности ничего не пересчитывает
+    trees = hdbscan_trees(X, min_samples_values, exact, progress_callback)
+    rows = []
+    for ms, mcs in product(min_samples_values, min_cluster_sizes):
+        started = time.perf_counter()
+        labels, probabilities, stabilities = condense_labels(trees[ms], mcs)
+        seconds = time.perf_counter() - started
+        for min_prob in min_probs:
+            rows.append({
+                "method": "hdbscan",
+                "min_samples": ms,
+                "min_cluster_size": mcs,
+                "min_prob": min_prob,
+                **_summary(labels, probabilities, mcs, min_prob),
+                "stability": round(float(np.sum(stabilities)), 4),
+                "mean_stability": round(float(np.mean(stabilities)), 4) if len(stabilities) else 0.0,
+                "seconds": round(seconds, 4),
+            })
+    return rows
+
+def radius_graph(X, eps):
+    # все пары с косинусным расстоянием не больше eps, по блокам X @ X.T — как knn_graph, но по радиусу
+    n = len(X)
+    block = max(1, KNN_BLOCK_CELLS // max(n, 1))
+    rows, cols, dists = [], [], []
+    for start in range(0, n, block):
+        d = 1 - X[start:start + block] @ X.T
+        r, c = np.nonzero(d <= eps)
+        rows.append(r + start)
+        cols.append(c)
+        # нулевое расстояние в разреженной матрице означает «нет ребра»
+        dists.append(np.maximum(d[r, c], 1e-6))
+    return sparse.csr_matrix((np.concatenate(dists), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+def sweep_dbscan(X, eps_values=SWEEP_EPS, min_samples_values=(2,), min_cluster_sizes=SWEEP_MIN_CLUSTER_SIZES, progress_callback=None):
+    # граф строится один раз на наибольший eps; DBSCAN с меньшим eps просто не смотрит на длинные рёбра
+    if progress_callback:
+        progress_callback.text(f"🕸️ Граф расстояний до eps={max(eps_values)} ({len(X)} лиц)")
+    graph = radius_graph(X, max(eps_values))
+    rows = []
+    for eps, ms in product(eps_values, min_samples_values):
+        started = time.perf_counter()
+        labels = DBSCAN(eps=eps, min_samples=ms, metric="precomputed").fit_predict(graph)
+        seconds = time.perf_counter() - started
+        for mcs in min_cluster_sizes:
+            rows.append({
+                "method": "dbscan",
+                "eps": eps,
+                "min_samples": ms,
+                "min_cluster_size": mcs,
+                **_summary(labels, (labels != -1).astype(np.float64), mcs, 0.0),
+                "seconds": round(seconds, 4),
+            })
+    return rows
@@ -0,0 +1,145 @@
+import hdbscan
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from sklearn.cluster import Birch, MiniBatchKMeans
+
+from facecluster.memory import PREDICT_CHUNK
+
+MICRO_RADIUS = 0.65  # радиус микрокластера в пространстве нормированных эмбеддингов (косинус к центру ≈ 0.79)
+CELL_FACES = 5000  # лиц в среднем на грубую ячейку
+COARSE_SAMPLE = 100000  # по скольким лицам строится грубое разбиение
+KMEANS_BATCH = 4096
+KNN_NEIGHBORS = 15
+KNN_BLOCK_CELLS = 2**25  # элементов в блоке матрицы сходства (float32, 128 МБ)
+MAX_DISTANCE = 2.0  # расстояние между противоположными единичными векторами
+LINK_FACTOR = 2.0  # центры микрокластеров дальше LINK_FACTOR·micro_radius друг от друга — разные люди
+
+def _assign(X, model, chunk=PREDICT_CHUNK):
+    # по кускам: X может быть memmap на диске
+    return np.concatenate([model.predict(np.asarray(X[i:i + chunk], dtype=np.float32)) for i in range(0, len(X), chunk)])
+
+def coarse_cells(X, seed=0):
+    n = len(X)
+    k = max(1, n // CELL_FACES)
+    if k == 1:
+        return np.zeros(n, dtype=np.int64), 1
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, min(n, COARSE_SAMPLE), replace=False))
+    model = MiniBatchKMeans(k, batch_size=KMEANS_BATCH, n_init=1, random_state=seed)
+    model.fit(np.asarray(X[sample], dtype=np.float32))
+    return _assign(X, model), k
+
+def _centroids(rows, labels, count):
+    sums = np.zeros((count, rows.shape[1]), dtype=np.float64)
+    np.add.at(sums, labels, rows)
+    return sums / np.bincount(labels, minlength=count)[:, None]
+
+def _split_outliers(rows, labels, radius):
+    # порог BIRCH — среднеквадратичный радиус, и крупный подкластер может поглотить далёкое лицо;
+    # лица дальше radius от центра становятся отдельными микрокластерами
+    count = int(labels.max()) + 1
+    far = np.linalg.norm(rows - _centroids(rows, labels, count)[labels], axis=1) > radius
+    if far.any():
+        labels = labels.copy()
+        labels[far] = count + np.arange(int(far.sum()))
+        labels = np.unique(labels, return_inverse=True)[1]
+    return labels
+
+def micro_cluster(X, radius=MICRO_RADIUS, seed=0, progress_callback=None):
+    # грубые ячейки k-means, внутри каждой — BIRCH с ограничением радиуса: микрокластер не шире radius,
+    # поэтому не смешивает разных людей. Один человек может попасть в несколько ячеек — его микрокластеры
+    # соберёт HDBSCAN на втором этапе
+    n = len(X)
+    cells, k = coarse_cells(X, seed)
+    micro = np.empty(n, dtype=np.int64)
+    centroids, sizes = [], []
+    offset = 0
+    order = np.argsort(cells, kind="stable")
+    bounds = np.searchsorted(cells[order], np.arange(k + 1))
+    for cell in range(k):
+        idx = order[bounds[cell]:bounds[cell + 1]]
+        if not len(idx):
+            continue
+        rows = np.asarray(X[idx], dtype=np.float32)
+        local = np.unique(Birch(threshold=radius, n_clusters=None).fit(rows).labels_, return_inverse=True)[1]
+        local = _split_outliers(rows, local, radius)
+        count = int(local.max()) + 1
+        micro[idx] = local + offset
+        offset += count
+        centroids.append(_centroids(rows, local, count))
+        sizes.append(np.bincount(local, minlength=count))
+        if progress_callback:
+            progress_callback.text(f"🧩 Микрокластеры: ячейка {cell + 1}/{k}, всего {offset}")
+    return micro, np.vstack(centroids), np.concatenate(sizes)
+
+def knn_graph(C, k=KNN_NEIGHBORS):
+    # разреженный граф k ближайших соседей по блокам C @ C.T: HDBSCAN по нему строит то же дерево,
+    # что и по всем парам, но без KD-дерева, которое в 512 измерениях вырождается в полный перебор
+    n = len(C)
+    k = min(k, n - 1)
+    block = max(1, KNN_BLOCK_CELLS // n)
+    rows, cols, dists = [], [], []
+    for start in range(0, n, block):
+        sim = C[start:start + block] @ C.T
+        idx = np.argpartition(-sim, k, axis=1)[:, :k + 1]
+        d = np.sqrt(np.maximum(2 - 2 * np.take_along_axis(sim, idx, axis=1), 0))
+        r = np.repeat(np.arange(start, start + len(sim)), k + 1)
+        keep = idx.ravel() != r
+        rows.append(r[keep])
+        cols.append(idx.ravel()[keep])
+        dists.append(d.ravel()[keep])
+    # нулевое расстояние в разреженной матрице означает «нет ребра»
+    dists = np.maximum(np.concatenate(dists), 1e-6)
+    graph = sparse.coo_matrix((dists, (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)).tocsr()
+    graph = graph.maximum(graph.T)
+    # несвязные компоненты (далёкие друг от друга люди) соединяются на максимальном расстоянии
+    count, component = csgraph.connected_components(graph, directed=False)
+    if count > 1:
+        first = np.unique(component, return_index=True)[1]
+        link = sparse.coo_matrix((np.full(count - 1, MAX_DISTANCE), (first[1:], np.full(count - 1, first[0]))), shape=(n, n)).tocsr()
+        graph = graph.maximum(link).maximum(link.T)
+    return graph
+
+def split_far_links(graph, labels, cut):
+    # HDBSCAN с min_cluster_size=2 собирает в кластер хотя бы пару ближайших центров, как бы далеко они
+    # ни были, а knn_graph соединяет компоненты на MAX_DISTANCE. Кластер остаётся только там, где центры
+    # связаны цепочкой рёбер не длиннее cut; одиночный центр после разделения — шум
+    graph = graph.tocoo()
+    keep = (graph.data <= cut) & (labels[graph.row] == labels[graph.col]) & (labels[graph.row] != -1)
+    near = sparse.coo_matrix((np.ones(int(keep.sum())), (graph.row[keep], graph.col[keep])), shape=graph.shape)
+    _, component = csgraph.connected_components(near, directed=False)
+    sizes = np.bincount(component)
+    split = np.where((labels == -1) | (sizes[component] < 2), -1, component)
+    return np.unique(split, return_inverse=True)[1] - (1 if (split == -1).any() else 0)
+
+def fit_two_stage(X, min_cluster_size=3, micro_radius=MICRO_RADIUS, progress_callback=None, seed=0):
+    # 1) микрокластеры, 2) HDBSCAN по их центрам, 3) метка центра — всем его лицам.
+    # Вероятность лица — 1, если его микрокластер попал в кластер: вероятности HDBSCAN по центрам
+    # описывают положение центра, а не лица, и порог min_prob по ним отбрасывал бы целые группы лиц.
+    # Минимальный размер кластера в лицах проверяется дальше, в cluster_scan, как и для обычного HDBSCAN
+    n = len(X)
+    micro, centroids, sizes = micro_cluster(X, micro_radius, seed, progress_callback)
+    centroids = (centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+    info = {"strategy": "two-stage", "faces": int(n), "micro_clusters": int(len(centroids)), "promoted": 0}
+    if progress_callback:
+        progress_callback.text(f"🧮 HDBSCAN по {len(centroids)} центрам микрокластеров ({n} лиц)")
+
+    # центр — уже усреднение многих лиц, поэтому на этом уровне min_samples=1 и кластер от двух центров
+    if len(centroids) > 2:
+        graph = knn_graph(centroids)
+        centroid_labels = hdbscan.HDBSCAN(min_cluster_size=2, min_samples=1, metric="precomputed").fit_predict(graph)
+        centroid_labels = split_far_links(graph, centroid_labels, LINK_FACTOR * micro_radius)
+    else:
+        centroid_labels = np.full(len(centroids), -1, dtype=np.int64)
+
+    # микрокластер, который HDBSCAN счёл шумом, но в котором не меньше min_cluster_size лиц (человек,
+    # чьи лица целиком уместились в один радиус), становится отдельным кластером
+    promote = np.flatnonzero((centroid_labels == -1) & (sizes >= min_cluster_size))
+    next_label = int(centroid_labels.max()) + 1
+    centroid_labels[promote] = np.arange(next_label, next_label + len(promote))
+    info["promoted"] = int(len(promote))
+    info["clusters"] = int(len(set(centroid_labels.tolist()) - {-1}))
+
+    labels = centroid_labels[micro]
+    return labels, (labels != -1).astype(np.float64), info
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # без watchdog папка опрашивается раз в POLL_INTERVAL секунд
+    FileSystemEventHandler = object
+    Observer = None
+
+from facecluster.cluster import is_image, scan_images
+from facecluster.distribute import JOURNAL_DIR, cluster_folder, default_journal_path, distribute_to_folders
+from facecluster.gallery import MATCH_THRESHOLD, build_gallery, identity_faces, load_gallery, match_faces, save_gallery
+from facecluster.planio import load_embeddings, load_plan
+
+POLL_INTERVAL = 1.0
+SETTLE_SECONDS = 2.0  # файл считается дописанным, если размер и mtime не менялись столько секунд
+REFERENCE_FILE = ".watch_reference.npz"
+
+def _dominant_faces(X):
+    # в папке кластера бывают общие фото с чужими лицами: оставляем лица, близкие к среднему папки
+    X = np.asarray(X, dtype=np.float32)
+    mean = X.mean(axis=0)
+    mean /= max(np.linalg.norm(mean), 1e-12)
+    keep = X @ mean >= MATCH_THRESHOLD
+    return X[keep] if keep.any() else X
+
+def cluster_dirs(folder: Path):
+    return sorted(p for p in Path(folder).iterdir() if p.is_dir() and not p.name.startswith("."))
+
+def reference_from_folders(folder: Path, app, skip=(), progress_callback=None, **scan_options):
+    # по уже разложенным папкам (cluster_N, имена из галереи): лица каждой папки — образцы её человека
+    per_name = {}
+    for d in cluster_dirs(folder):
+        if d.name in skip:
+            continue
+        images = sorted(p for p in d.iterdir() if p.is_file() and is_image(p))
+        if progress_callback:
+            progress_callback.text(f"🗂 Образцы: {d.name} ({len(images)} фото)")
+        scan = scan_images(images, app, None, **scan_options)
+        if len(scan["embeddings"]):
+            per_name[d.name] = _dominant_faces(scan["embeddings"])
+    return per_name
+
+def reference_from_plan(plan_path: Path):
+    # по плану с --keep-embeddings: без повторной детекции, папка кластера — как при распределении
+    plan = load_plan(plan_path)
+    X = load_embeddings(plan_path)
+    if X is None or "faces" not in plan:
+        raise ValueError(f"{plan_path}: в плане нет эмбеддингов лиц, постройте его с --keep-embeddings")
+    rows = {}
+    for row, cid in zip(plan["faces"]["embedding_row"], plan["faces"]["cluster"]):
+        if cid != -1:
+            rows.setdefault(cid, []).append(row)
+    return {cluster_folder(cid, plan.get("names")): np.asarray(X[r], dtype=np.float32) for cid, r in sorted(rows.items())}
+
+def load_reference(folder: Path, app, plan_path=None, gallery=None, rebuild=False, progress_callback=None, **scan_options):
+    # галерея + существующие кластеры. Образцы по папкам кэшируются в <папка>/.watch_reference.npz
+    # и пересчитываются, только когда меняется набор папок
+    folder = Path(folder)
+    per_name = {}
+    if gallery is not None:
+        names = dict(enumerate(gallery["names"]))
+        for i, faces in enumerate(identity_faces(gallery).values()):
+            per_name[cluster_folder(i, names)] = faces
+    if plan_path:
+        for name, faces in reference_from_plan(Path(plan_path)).items():
+            per_name.setdefault(name, faces)
+        return build_gallery(per_name, {"source": "plan"})
+
+    cache = folder / JOURNAL_DIR / REFERENCE_FILE
+    source = [d.name for d in cluster_dirs(folder) if d.name not in per_name]
+    if cache.exists() and not rebuild:
+        cached = load_gallery(cache)
+        if cached["meta"].get("source") == source:
+            for name, faces in identity_faces(cached).items():
+                per_name.setdefault(name, faces)
+            return build_gallery(per_name, {"source": "folders"})
+
+    scanned = reference_from_folders(folder, app, skip=set(per_name), progress_callback=progress_callback, **scan_options)
+    save_gallery(build_gallery(scanned, {"source": source}), cache)
+    for name, faces in scanned.items():
+        per_name.setdefault(name, faces)
+    return build_gallery(per_name, {"source": "folders"})
+
+class FolderWatcher:
+    # только верхний уровень папки: во вложенных cluster_N лежат уже разобранные фото
+    def __init__(self, folder: Path, settle=SETTLE_SECONDS):
+        self.folder = Path(folder)
+        self.settle = settle
+        self.seen = {}  # путь → (размер, mtime), с которыми файл уже обработан
+        self.pending = {}  # путь → (размер, mtime, с какого момента не меняется)
+
+    def poll(self, now=None):
+        now = time.time() if now is None else now
+        ready = []
+        current = set()
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.is_file() or not is_image(Path(entry.name)):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                path = Path(entry.path)
+                current.add(path)
+                sig = (st.st_size, st.st_mtime)
+                if self.seen.get(path) == sig:
+                    continue
+                prev = self.pending.get(path)
+                if prev is None or prev[:2] != sig:
+                    self.pending[path] = (*sig, now)
+                elif now - prev[2] >= self.settle and st.st_size > 0:
+                    ready.append(path)
+        for path in list(self.pending):
+            if path not in current:
+                del self.pending[path]
+        for path in ready:
+            self.seen[path] = self.pending.pop(path)[:2]
+        self.seen = {p: sig for p, sig in self.seen.items() if p in current}
+        return sorted(ready)
+
+    def mark_existing(self):
+        # файлы, лежавшие в папке до запуска, не трогаем: их разбирает обычный run
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.is_file() and is_image(Path(entry.name)):
+                    st = entry.stat()
+                    self.seen[Path(entry.path)] = (st.st_size, st.st_mtime)
+
+class _Wake(FileSystemEventHandler):
+    def __init__(self, event):
+        self.event = event
+
+    def on_any_event(self, event):
+        self.event.set()
+
+def sort_new_files(paths, folder: Path, app, reference, match_threshold=MATCH_THRESHOLD, report=None, **scan_options):
+    # новые фото → эмбеддинги → ближайший человек/кластер → перенос в его папку (с журналом, как run)
+    started = time.time()
+    scan = scan_images(paths, app, None, **scan_options)
+    identity, _ = match_faces(scan["embeddings"], reference, match_threshold)
+    by_img = {}
+    for owner, ident in zip(scan["owners"], identity):
+        if ident != -1:
+            by_img.setdefault(owner, set()).add(int(ident))
+    plan = {
+        "plan": [{"path": str(p), "cluster": sorted(by_img[p])} for p in paths if p in by_img],
+        "names": dict(enumerate(reference["names"])),
+    }
+    result = {
+        "files": len(paths),
+        "sorted": len(plan["plan"]),
+        "unmatched": [str(p) for p in sorted(set(scan["owners"]) - set(by_img))],
+        "no_faces": [str(p) for p in scan["no_faces"]],
+        "unreadable": [str(p) for p in scan["unreadable"]],
+        "moved": 0,
+        "copied": 0,
+    }
+    if plan["plan"]:
+        journal_path = default_journal_path(folder)
+        result["moved"], result["copied"] = distribute_to_folders(plan, folder, report=report, journal_path=journal_path)
+        result["journal"] = str(journal_path)
+        result["folders"] = sorted({cluster_folder(cid, plan["names"]) for entry in plan["plan"] for cid in entry["cluster"]})
+    result["seconds"] = round(time.time() - started, 3)
+    return result
+
+def watch_folder(folder: Path, app, reference, on_batch, match_threshold=MATCH_THRESHOLD, settle=SETTLE_SECONDS, interval=POLL_INTERVAL, include_existing=False, stop_event=None, report=None, **scan_options):
+    # модель и образцы загружены один раз; цикл: дождаться стабильных файлов → разобрать только их
+    folder = Path(folder)
+    stop_event = stop_event or threading.Event()
+    watcher = FolderWatcher(folder, settle)
+    if not include_existing:
+        watcher.mark_existing()
+    wake = threading.Event()
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_Wake(wake), str(folder), recursive=False)
+        observer.start()
+    try:
+        while not stop_event.is_set():
+            ready = watcher.poll()
+            if ready:
+                on_batch(sort_new_files(ready, folder, app, reference, match_threshold, report, **scan_options))
+            # с watchdog просыпаемся по событию, но пока файлы «дозревают», всё равно перепроверяем по таймеру
+            timeout = min(interval, settle) if watcher.pending else interval
+            if observer is not None and not watcher.pending:
+                timeout = max(interval, 60.0)
+            wake.wait(timeout)
+            wake.clear()
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
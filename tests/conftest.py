@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from tests.helpers import GOLDEN_DIR, StubApp, make_photo_set
+
+def pytest_addoption(parser):
+    parser.addoption("--update-golden", action="store_true", help="перезаписать tests/golden/*.json текущими планами")
+    parser.addoption("--update-baselines", action="store_true", help="перезаписать tests/baselines.json текущими замерами")
+
+@pytest.fixture
+def stub_app():
+    return StubApp()
+
+@pytest.fixture
+def photo_dir(tmp_path):
+    return make_photo_set(tmp_path / "фото")
+
+@pytest.fixture
+def golden(request):
+    def check(name, value):
+        path = GOLDEN_DIR / f"{name}.json"
+        if request.config.getoption("--update-golden"):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(value, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        elif not path.exists():
+            pytest.fail(f"нет эталона {path.name}: запустите pytest --update-golden, проверьте и закоммитьте")
+        assert value == json.loads(path.read_text(encoding="utf-8"))
+    return check
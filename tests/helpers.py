@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+TESTS_DIR = Path(__file__).resolve().parent
+GOLDEN_DIR = TESTS_DIR / "golden"
+DIM = 512
+WIDTH, HEIGHT = 96, 64
+
+class StubFace:
+    def __init__(self, bbox, det_score, embedding):
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.det_score = det_score
+        self.embedding = embedding
+
+    @property
+    def normed_embedding(self):
+        return self.embedding / np.linalg.norm(self.embedding)
+
+def identity_embedding(identity, variant, noise=0.35):
+    # база — по номеру человека, шум — по номеру снимка: кластеры плотные, но не вырожденные
+    base = np.random.default_rng(identity).normal(size=DIM)
+    return (base + np.random.default_rng(10_000 + identity * 100 + variant).normal(size=DIM) * noise).astype(np.float32)
+
+class StubApp:
+    # детектор и эмбеддер без моделей. Каждая половина снимка — одно лицо: синий канал — номер человека
+    # (20·n + 10, 0 — лица нет), зелёный — номер снимка. Цвета однородные, поэтому переживают JPEG
+    def __init__(self):
+        self.models = {}
+        self.calls = 0
+
+    def get(self, img):
+        self.calls += 1
+        h, w = img.shape[:2]
+        faces = []
+        for x0, x1 in ((0, w // 2), (w // 2, w)):
+            b, g = (int(v) for v in img[h // 2, (x0 + x1) // 2, :2])
+            if b < 20:
+                continue
+            faces.append(StubFace([x0 + 4, 4, x1 - 4, h - 4], 0.9, identity_embedding(round((b - 10) / 20), round(g / 4))))
+        return faces
+
+def synthetic_image(left, right=None, variant=0, size=(WIDTH, HEIGHT)):
+    w, h = size
+    img = np.full((h, w, 3), 128, dtype=np.uint8)
+    for x0, x1, identity in ((0, w // 2, left), (w // 2, w, right)):
+        img[:, x0:x1, 0] = 0 if identity is None else 20 * identity + 10
+        img[:, x0:x1, 1] = 4 * variant
+    return img
+
+def write_image(path: Path, img):
+    # через imencode: cv2.imwrite не пишет по путям с кириллицей в Windows
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ok, buf = cv2.imencode(path.suffix, img)
+    assert ok
+    buf.tofile(str(path))
+
+def make_photo_set(root: Path, identities=4, per_identity=6):
+    # 4 человека по 6 снимков, 3 общих фото, снимок без лиц, битый файл и миниатюра (для --min-side)
+    for identity in range(1, identities + 1):
+        for variant in range(per_identity):
+            write_image(root / f"Человек_{identity}" / f"Фото {identity}-{variant}.jpg", synthetic_image(identity, identity, variant))
+    for variant, (a, b) in enumerate(((1, 2), (2, 3), (3, 4))):
+        write_image(root / "общие" / f"вместе_{a}_{b}.jpg", synthetic_image(a, b, variant + 10))
+    write_image(root / "пустой.png", synthetic_image(None, None))
+    (root / "битый.jpg").write_bytes(b"\xff\xd8\xff\xe0 not a jpeg")
+    write_image(root / "миниатюра.jpg", synthetic_image(1, 1, 20, size=(24, 16)))
+    return root
+
+def synthetic_embeddings(faces, identities, noise=0.35, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = rng.integers(0, identities, faces)
+    X = rng.normal(size=(identities, DIM))[truth] + rng.normal(size=(faces, DIM)) * noise
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32), truth
+
+def normalized_plan(plan, root: Path):
+    # номера кластеров зависят от порядка меток HDBSCAN, смысл плана — какие файлы вместе
+    rel = lambda p: Path(p).relative_to(root).as_posix()
+    return {
+        "clusters": sorted(sorted(rel(p) for p in paths) for paths in plan["clusters"].values()),
+        "copies": dict(sorted((rel(e["path"]), len(e["cluster"])) for e in plan["plan"] if len(e["cluster"]) > 1)),
+        **{key: sorted(rel(p) for p in plan.get(key, [])) for key in ("unreadable", "no_faces", "skipped_small")},
+    }
+
+def mixed_clusters(plan):
+    # кластеры, где вместе оказались одиночные снимки разных людей (папка Человек_N — номер человека)
+    mixed = []
+    for cid, paths in plan["clusters"].items():
+        people = {Path(p).parent.name for p in paths if Path(p).parent.name.startswith("Человек_")}
+        if len(people) > 1:
+            mixed.append(cid)
+    return mixed
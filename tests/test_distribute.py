@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import pytest
+
+from facecluster.cluster import build_plan_live, list_images, renumber_clusters
+from facecluster.distribute import Journal, apply_journal, cluster_folder, distribute_to_folders, dry_run, plan_operations, undo_journal
+
+@pytest.fixture
+def plan(photo_dir, stub_app):
+    plan = build_plan_live(photo_dir, app=stub_app)
+    renumber_clusters(plan)
+    return plan
+
+def snapshot(root: Path):
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file())
+
+def test_distribute_and_undo(photo_dir, plan):
+    before = snapshot(photo_dir)
+    journal = photo_dir.parent / "journal.ndjson"
+    moved, copied = distribute_to_folders(plan, photo_dir, report=lambda level, text: pytest.fail(text), journal_path=journal)
+    # общее фото считается копией в каждый свой кластер, оригинал не остаётся
+    assert moved == sum(len(e["cluster"]) == 1 for e in plan["plan"])
+    assert copied == sum(len(e["cluster"]) for e in plan["plan"] if len(e["cluster"]) > 1)
+    for cid, paths in plan["clusters"].items():
+        assert sorted(p.name for p in (photo_dir / cluster_folder(cid)).iterdir()) == sorted(Path(p).name for p in paths)
+    assert not (photo_dir / "общие" / "вместе_1_2.jpg").exists()
+
+    restored, removed = undo_journal(journal, report=lambda level, text: pytest.fail(text))
+    # откат: каждое фото возвращается на место, лишние копии удаляются
+    assert (restored, removed) == (len(plan["plan"]), sum(len(e["cluster"]) - 1 for e in plan["plan"]))
+    assert snapshot(photo_dir) == before
+
+def test_keep_originals(photo_dir, plan):
+    images = sorted(list_images(photo_dir))
+    distribute_to_folders(plan, photo_dir, journal_path=photo_dir.parent / "journal.ndjson", keep_originals=True)
+    assert sorted(list_images(photo_dir / "Человек_1")) == [p for p in images if p.parent.name == "Человек_1"]
+    assert len(list(photo_dir.glob("cluster_*"))) == len(plan["clusters"])
+
+def test_dry_run_counts(photo_dir, plan):
+    report = dry_run(plan, photo_dir)
+    assert report["operations"] == sum(len(e["cluster"]) for e in plan["plan"])
+    assert report["missing"] == 0
+    assert not list(photo_dir.glob("cluster_*"))
+
+def test_same_names_are_not_overwritten(tmp_path):
+    # IMG_1.jpg из двух папок в одном кластере и такой же файл, уже лежащий в cluster_1
+    for folder in ("a", "b", "cluster_1"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "IMG_1.jpg").write_bytes(folder.encode())
+    plan = {"plan": [{"path": str(tmp_path / folder / "IMG_1.jpg"), "cluster": [1]} for folder in ("a", "b")]}
+    journal = tmp_path / "journal.ndjson"
+    assert distribute_to_folders(plan, tmp_path, journal_path=journal) == (2, 0)
+    contents = sorted(p.read_bytes() for p in (tmp_path / "cluster_1").iterdir())
+    assert contents == [b"a", b"b", b"cluster_1"]
+    assert undo_journal(journal) == (2, 0)
+    assert (tmp_path / "a" / "IMG_1.jpg").read_bytes() == b"a"
+    assert (tmp_path / "b" / "IMG_1.jpg").read_bytes() == b"b"
+
+def test_existing_destination_is_refused(tmp_path):
+    # файл появился в кластере уже после планирования: операция не выполняется, оригинал на месте
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "IMG_1.jpg").write_bytes(b"a")
+    plan = {"plan": [{"path": str(tmp_path / "a" / "IMG_1.jpg"), "cluster": [1]}]}
+    journal = tmp_path / "journal.ndjson"
+    Journal(journal).create(tmp_path, plan_operations(plan, tmp_path))
+    (tmp_path / "cluster_1").mkdir()
+    (tmp_path / "cluster_1" / "IMG_1.jpg").write_bytes(b"other")
+    errors = []
+    assert apply_journal(journal, report=lambda level, text: errors.append(text)) == (0, 0)
+    assert len(errors) == 1
+    assert (tmp_path / "a" / "IMG_1.jpg").read_bytes() == b"a"
+    assert (tmp_path / "cluster_1" / "IMG_1.jpg").read_bytes() == b"other"
+
+def test_dry_run_matches_apply(photo_dir, plan):
+    report = dry_run(plan, photo_dir)
+    moved, copied = distribute_to_folders(plan, photo_dir, journal_path=photo_dir.parent / "journal.ndjson")
+    assert (report["moved"], report["copied"]) == (moved, copied)
+
+def test_undo_keeps_new_file_with_same_name(tmp_path):
+    # после распределения в исходную папку пришёл другой IMG_1.jpg: откат не должен его затереть
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "IMG_1.jpg").write_bytes(b"old")
+    plan = {"plan": [{"path": str(tmp_path / "a" / "IMG_1.jpg"), "cluster": [1]}]}
+    journal = tmp_path / "journal.ndjson"
+    distribute_to_folders(plan, tmp_path, journal_path=journal)
+    (tmp_path / "a").mkdir(exist_ok=True)  # опустевшая папка удаляется при распределении
+    (tmp_path / "a" / "IMG_1.jpg").write_bytes(b"new")
+    warnings = []
+    assert undo_journal(journal, report=lambda level, text: warnings.append(level)) == (1, 0)
+    assert warnings == ["warning"]
+    assert (tmp_path / "a" / "IMG_1.jpg").read_bytes() == b"new"
+    assert (tmp_path / "a" / "IMG_1 (2).jpg").read_bytes() == b"old"
@@ -0,0 +1,43 @@
+import pytest
+
+from facecluster import cluster
+from facecluster.cluster import imread_safe, list_images, load_image
+from tests.helpers import synthetic_image, write_image
+
+def test_cyrillic_path(tmp_path):
+    # кириллица и пробел в пути: cv2.imread на Windows их не читает
+    path = tmp_path / "Папка с пробелом" / "Фото27.jpg"
+    write_image(path, synthetic_image(1, 2))
+    img = imread_safe(path)
+    assert img is not None and img.shape == (64, 96, 3)
+
+def test_unreadable_and_small(photo_dir):
+    assert imread_safe(photo_dir / "битый.jpg") is None
+    img, header, small = load_image(photo_dir / "миниатюра.jpg", min_side=32)
+    assert img is None and small and (header["width"], header["height"]) == (24, 16)
+
+def test_list_images(photo_dir):
+    names = {p.name for p in list_images(photo_dir)}
+    assert {"пустой.png", "битый.jpg", "миниатюра.jpg", "вместе_1_2.jpg"} <= names
+    assert len(names) == 4 * 6 + 3 + 3
+
+@pytest.mark.parametrize("with_header", [True, False])
+def test_exif_orientation(tmp_path, monkeypatch, with_header):
+    # поворот по EXIF сохраняется и тогда, когда Pillow не смог прочитать заголовок
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "повёрнутое.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (40, 20), "white").save(path, exif=exif)
+    if not with_header:
+        monkeypatch.setattr(cluster, "read_header", lambda path: None)
+    assert cluster.imread_safe(path).shape[:2] == (40, 20)
+
+def test_header_is_read_once(photo_dir, monkeypatch):
+    # у битого файла заголовок не читается — load_image не должен открывать его Pillow второй раз
+    calls = []
+    read_header = cluster.read_header
+    monkeypatch.setattr(cluster, "read_header", lambda path: calls.append(path) or read_header(path))
+    img, header, small = load_image(photo_dir / "битый.jpg")
+    assert img is None and header is None and not small
+    assert len(calls) == 1
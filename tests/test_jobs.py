@@ -0,0 +1,29 @@
+import time
+
+from facecluster.jobs import DONE, FINISHED, UNDO, JobManager
+from tests.helpers import StubApp
+
+def wait(job, timeout=30):
+    deadline = time.time() + timeout
+    while job.status not in FINISHED:
+        assert time.time() < deadline, f"задача {job.id} не завершилась"
+        time.sleep(0.05)
+    assert job.status == DONE, job.error
+
+def snapshot(root):
+    return sorted(p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file() and ".distribute_journal" not in p.parts)
+
+def test_distribute_then_undo_in_background(photo_dir, tmp_path):
+    manager = JobManager(plan_dir=tmp_path)
+    manager._models[((1024, 1024), ())] = StubApp()
+    before = snapshot(photo_dir)
+    job, = manager.submit([photo_dir])
+    wait(job)
+    assert snapshot(photo_dir) != before
+
+    undo = manager.undo(job.id)
+    assert undo.kind == UNDO and manager.undo(job.id) is None
+    wait(undo)
+    assert undo.result["restored"] > 0
+    assert job.result["undone"]
+    assert snapshot(photo_dir) == before
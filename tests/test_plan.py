@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from facecluster.cluster import build_plan_live, list_images, scan_images
+from facecluster.gallery import add_identity, empty_gallery
+from facecluster.memory import EmbeddingSpill
+from facecluster.pipeline import Pipeline
+from tests.helpers import identity_embedding, make_photo_set, mixed_clusters, normalized_plan
+
+@pytest.mark.parametrize("method", ["hdbscan", "two-stage", "dbscan"])
+def test_golden_plan(photo_dir, stub_app, golden, method):
+    plan = build_plan_live(photo_dir, app=stub_app, method=method, min_side=32)
+    assert not mixed_clusters(plan)
+    golden(f"plan_{method}", normalized_plan(plan, photo_dir))
+
+@pytest.mark.parametrize("method", ["hdbscan", "two-stage", "dbscan"])
+def test_each_cluster_is_one_person(tmp_path, stub_app, method):
+    # 12 человек, каждый — один плотный микрокластер: two-stage не должен сливать соседние центры
+    root = make_photo_set(tmp_path / "фото", identities=12, per_identity=4)
+    plan = build_plan_live(root, app=stub_app, method=method)
+    assert not mixed_clusters(plan)
+    assert len(plan["clusters"]) == 12
+
+def test_golden_plan_largest_face(photo_dir, stub_app, golden):
+    plan = build_plan_live(photo_dir, app=stub_app, largest_face=True)
+    golden("plan_largest_face", normalized_plan(plan, photo_dir))
+
+def test_golden_plan_gallery(photo_dir, stub_app, golden):
+    gallery = add_identity(empty_gallery(), "Аня", [identity_embedding(2, v) for v in range(30, 34)])
+    plan = build_plan_live(photo_dir, app=stub_app, gallery=gallery)
+    assert sorted(plan["names"].values()) == ["Аня"]
+    golden("plan_gallery", {**normalized_plan(plan, photo_dir), "named": sorted(Path(plan["clusters"][cid][0]).parent.name for cid in plan["names"])})
+
+def test_scan_does_not_depend_on_threads(photo_dir, stub_app):
+    images = sorted(list_images(photo_dir))
+    single = scan_images(images, stub_app)
+    threaded = scan_images(images, stub_app, workers=4, batch_size=3)
+    assert single["owners"] == threaded["owners"]
+    np.testing.assert_array_equal(single["embeddings"], threaded["embeddings"])
+    np.testing.assert_array_equal(single["bboxes"], threaded["bboxes"])
+
+def test_plan_is_repeatable(photo_dir, stub_app):
+    first = build_plan_live(photo_dir, app=stub_app, keep_faces=True, workers=2)
+    second = build_plan_live(photo_dir, app=stub_app, keep_faces=True)
+    assert first["clusters"] == second["clusters"]
+    assert first["faces"] == second["faces"]
+
+def test_pipeline_matches_build_plan_live(photo_dir, stub_app):
+    pipeline = Pipeline(clusterer={"method": "two-stage"})
+    pipeline._app = stub_app
+    assert pipeline.plan(photo_dir) == build_plan_live(photo_dir, app=stub_app, method="two-stage")
+
+def test_pipeline_rejects_unknown_options():
+    with pytest.raises(ValueError):
+        Pipeline(reader={"wokers": 2})
+    with pytest.raises(ValueError):
+        Pipeline(scanner={})
+
+def test_embeddings_outlive_spill(photo_dir, stub_app, tmp_path, monkeypatch):
+    # с бюджетом памяти эмбеддинги идут через файл подкачки: план не должен ссылаться на удалённый файл
+    spills = []
+    finish = EmbeddingSpill.finish
+    monkeypatch.setattr(EmbeddingSpill, "finish", lambda self: spills.append(finish(self)) or spills[-1])
+    plan = build_plan_live(photo_dir, app=stub_app, memory_budget_mb=64, spill_dir=tmp_path / "spill", keep_embeddings=True)
+    assert spills and not np.shares_memory(plan["embeddings"], spills[0])
+    assert not list((tmp_path / "spill").iterdir())
+    assert plan["embeddings"].shape == (len(spills[0]), spills[0].shape[1])
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from facecluster.cluster import build_plan_live
+from facecluster.planio import convert_plan, load_embeddings, load_plan, save_plan
+
+@pytest.fixture
+def plan(photo_dir, stub_app):
+    return build_plan_live(photo_dir, app=stub_app, keep_embeddings=True, min_side=32)
+
+@pytest.mark.parametrize("fmt", ["npz", "ndjson", "json"])
+def test_roundtrip(plan, tmp_path, fmt):
+    path = save_plan(plan, tmp_path / f"plan.{fmt}")
+    loaded = load_plan(path)
+    assert loaded["clusters"] == plan["clusters"]
+    assert sorted(loaded["plan"], key=lambda e: e["path"]) == sorted(plan["plan"], key=lambda e: e["path"])
+    for key in ("unreadable", "no_faces", "skipped_small"):
+        assert loaded[key] == plan[key]
+    assert loaded["faces"]["cluster"] == plan["faces"]["cluster"]
+    assert loaded["faces"]["path"] == plan["faces"]["path"]
+
+def test_embeddings_only_in_npz(plan, tmp_path):
+    np.testing.assert_array_equal(load_embeddings(save_plan(plan, tmp_path / "plan.npz")), plan["embeddings"])
+    assert load_embeddings(save_plan(plan, tmp_path / "plan.json")) is None
+
+def test_convert(plan, tmp_path):
+    src = save_plan(plan, tmp_path / "plan.npz")
+    dst = convert_plan(src, tmp_path / "plan.ndjson")
+    assert load_plan(dst)["clusters"] == plan["clusters"]
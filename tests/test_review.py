@@ -0,0 +1,18 @@
+import pytest
+
+from facecluster.review import merge_clusters
+
+@pytest.fixture
+def plan():
+    entries = [{"path": f"/фото/{c}_{i}.jpg", "cluster": [c]} for c in (1, 2, 3) for i in range(2)]
+    return {"plan": entries, "clusters": {c: [e["path"] for e in entries if e["cluster"] == [c]] for c in (1, 2, 3)}, "names": {3: "Аня"}}
+
+def test_merge(plan):
+    assert merge_clusters(plan, [[1, 3], [2]]) == {1: 3}
+    assert sorted(plan["clusters"]) == [2, 3] and len(plan["clusters"][3]) == 4
+    assert plan["names"] == {3: "Аня"}
+
+@pytest.mark.parametrize("groups", [[[7]], [[1, 7]], [[1, 2], [9]]])
+def test_unknown_cluster(plan, groups):
+    with pytest.raises(ValueError, match="нет кластеров"):
+        merge_clusters(plan, groups)
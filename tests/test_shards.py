@@ -0,0 +1,34 @@
+import shutil
+
+import pytest
+
+from facecluster import shards
+from facecluster.cluster import build_plan_live
+from tests.helpers import StubApp, make_photo_set
+
+@pytest.fixture
+def stub_model(monkeypatch):
+    monkeypatch.setattr(shards, "load_model", lambda *args, **kwargs: StubApp())
+
+def scan_two_nodes(tmp_path, **options):
+    # один NAS, смонтированный на двух узлах по разным путям
+    first = make_photo_set(tmp_path / "mountA" / "event")
+    second = tmp_path / "mountB" / "event"
+    shutil.copytree(first, second)
+    paths = [tmp_path / "s0.npz", tmp_path / "s1.npz"]
+    shards.scan_shard(first, paths[0], index=0, count=2)
+    shards.scan_shard(second, paths[1], index=1, count=2, **options)
+    return first, paths
+
+def test_merge_from_different_mounts(tmp_path, stub_model):
+    first, paths = scan_two_nodes(tmp_path)
+    plan, root = shards.merge_shards(paths, root=first)
+    assert root == first
+    assert sorted(map(sorted, plan["clusters"].values())) == sorted(map(sorted, build_plan_live(first, app=StubApp())["clusters"].values()))
+    with pytest.raises(ValueError, match="--root"):
+        shards.merge_shards(paths)
+
+def test_merge_rejects_different_scan_options(tmp_path, stub_model):
+    first, paths = scan_two_nodes(tmp_path, largest_face=True)
+    with pytest.raises(ValueError, match="largest_face"):
+        shards.merge_shards(paths, root=first)
@@ -0,0 +1,19 @@
+import hdbscan
+import numpy as np
+import pytest
+
+from facecluster import sweep
+from tests.helpers import synthetic_embeddings
+
+def test_exact_sweep_matches_hdbscan():
+    X, _ = synthetic_embeddings(300, 12)
+    rows = sweep.sweep_hdbscan(X, min_cluster_sizes=(3, 5), min_samples_values=(1, 2), min_probs=(0.0,), exact=True)
+    for row in rows:
+        labels = hdbscan.HDBSCAN(min_cluster_size=row["min_cluster_size"], min_samples=row["min_samples"]).fit_predict(X)
+        sizes = np.bincount(labels[labels != -1])
+        assert row["clusters"] == int((sizes >= row["min_cluster_size"]).sum())
+
+def test_incompatible_hdbscan(monkeypatch):
+    monkeypatch.setattr(sweep, "_tree_to_labels", lambda *args: ("labels",))
+    with pytest.raises(RuntimeError, match="hdbscan"):
+        sweep.condense_labels(np.zeros((3, 4)), 2)
@@ -0,0 +1,89 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from facecluster.cluster import build_plan_live, fit_labels, list_images, renumber_clusters, scan_images
+from facecluster.distribute import distribute_to_folders, undo_journal
+from facecluster.planio import load_plan, save_plan
+from tests.helpers import TESTS_DIR, make_photo_set, synthetic_embeddings
+
+# время этапа хранится в долях калибровочной нагрузки: так замер переносим между машинами.
+# Тест падает, если этап стал медленнее эталона больше чем на TOLERANCE (1.0 — вдвое: общие CI-машины шумят)
+BASELINES = TESTS_DIR / "baselines.json"
+TOLERANCE = 1.0
+REPEATS = 5
+
+pytestmark = pytest.mark.perf
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _calibration_load():
+    # смесь numpy и чистого питона — примерно как в этапах конвейера
+    a = np.random.default_rng(0).normal(size=(400, 512)).astype(np.float32)
+    for _ in range(20):
+        a @ a.T
+    sum(i * i for i in range(300_000))
+
+@pytest.fixture(scope="module")
+def calibration():
+    return best_of(_calibration_load, repeats=5)
+
+@pytest.fixture
+def baseline(request, calibration):
+    update = request.config.getoption("--update-baselines")
+
+    def check(stage, seconds):
+        relative = seconds / calibration
+        data = json.loads(BASELINES.read_text(encoding="utf-8")) if BASELINES.exists() else {"tolerance": TOLERANCE, "stages": {}}
+        if update:
+            data["stages"][stage] = round(relative, 3)
+            BASELINES.write_text(json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+            return
+        if stage not in data["stages"]:
+            pytest.fail(f"нет эталона для {stage} ({relative:.3f} калибровок): запустите pytest -m perf --update-baselines")
+        limit = data["stages"][stage] * (1 + data.get("tolerance", TOLERANCE))
+        assert relative <= limit, f"{stage}: {relative:.3f} калибровок, эталон {data['stages'][stage]:.3f} (+{data.get('tolerance', TOLERANCE):.0%})"
+    return check
+
+@pytest.fixture(scope="module")
+def big_photo_dir(tmp_path_factory):
+    return make_photo_set(tmp_path_factory.mktemp("скорость") / "фото", identities=8, per_identity=14)
+
+def test_scan(big_photo_dir, stub_app, baseline):
+    images = sorted(list_images(big_photo_dir))
+    baseline("scan", best_of(lambda: scan_images(images, stub_app)))
+
+def test_scan_threads(big_photo_dir, stub_app, baseline):
+    images = sorted(list_images(big_photo_dir))
+    baseline("scan_threads", best_of(lambda: scan_images(images, stub_app, workers=4)))
+
+@pytest.mark.parametrize("method", ["hdbscan", "two-stage"])
+def test_cluster(method, baseline):
+    X, _ = synthetic_embeddings(1500, 40)
+    baseline(f"cluster_{method}", best_of(lambda: fit_labels(X, method=method)))
+
+def test_distribute(big_photo_dir, stub_app, baseline, tmp_path):
+    plan = build_plan_live(big_photo_dir, app=stub_app)
+    renumber_clusters(plan)
+    journal = tmp_path / "journal.ndjson"
+
+    def run():
+        distribute_to_folders(plan, big_photo_dir, journal_path=journal)
+        undo_journal(journal)
+    baseline("distribute_undo", best_of(run))
+
+def test_plan_io(big_photo_dir, stub_app, baseline, tmp_path):
+    plan = build_plan_live(big_photo_dir, app=stub_app, keep_faces=True, keep_embeddings=True)
+
+    def run():
+        for fmt in ("npz", "ndjson"):
+            load_plan(save_plan(plan, tmp_path / f"plan.{fmt}"))
+    baseline("plan_io", best_of(run))
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from facecluster.twostage import fit_two_stage
+
+def identities(count, per_identity, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = np.repeat(np.arange(count), per_identity)
+    X = rng.normal(size=(count, 512))[truth] + rng.normal(size=(len(truth), 512)) * noise
+    return (X / np.linalg.norm(X, axis=1, keepdims=True)).astype(np.float32), truth
+
+@pytest.mark.parametrize("noise", [0.02, 0.4])
+def test_clusters_do_not_mix_people(noise):
+    # каждый человек — один плотный микрокластер: далёкие центры не должны сливаться парами
+    X, truth = identities(20, 30, noise)
+    labels, _, info = fit_two_stage(X)
+    for label in set(labels.tolist()) - {-1}:
+        assert len(set(truth[labels == label].tolist())) == 1, f"кластер {label} смешивает людей"
+    assert info["clusters"] == 20